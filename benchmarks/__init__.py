@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/benchmarks/__init__.py
+"""
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic master lists and blocklists shaped like the Firebog sources
+"""
+
+import random
+
+
+#
+WORDS = ['ads', 'ad', 'track', 'tracker', 'stats', 'metrics', 'pixel', 'cdn',
+         'static', 'click', 'banner', 'media', 'analytics', 'tag', 'beacon',
+         'serve', 'img', 'api', 'log', 'collect', 'mobile', 'secure', 'www']
+
+TLDS = ['com', 'net', 'org', 'io', 'info', 'biz', 'ru', 'cn', 'de', 'co.uk',
+        'xyz', 'top', 'online', 'site']
+
+CATEGORIES = ['suspicious', 'advertising', 'tracking', 'malicious', 'other']
+QUALITIES = ['tick', 'std', 'cross']
+
+STYLES = ['hosts', 'plain', 'mixed']
+
+
+#
+def random_label(rng):
+    if rng.random() < 0.5:
+        return rng.choice(WORDS) + str(rng.randrange(1000))
+
+    length = rng.randint(3, 14)
+    return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789-') for _ in range(length - 1)) + rng.choice('abcdefghijklmnopqrstuvwxyz')   # noqa: E501
+
+
+#
+def random_fqdn(rng):
+    labels = [random_label(rng) for _ in range(rng.choice([1, 1, 2, 2, 3]))]
+    return '.'.join(labels + [rng.choice(TLDS)])
+
+
+#
+def blocklist(count, style='mixed', seed=0):
+    # count lines of a blocklist in the given style, as bytes
+    rng = random.Random(seed)
+    lines = ['# synthetic blocklist', f'# {count} entries', '']
+
+    for _ in range(count):
+        fqdn = random_fqdn(rng)
+
+        if style == 'hosts':
+            lines.append(f'0.0.0.0 {fqdn}')
+            continue
+
+        if style == 'plain':
+            lines.append(fqdn)
+            continue
+
+        r = rng.random()
+        if r < 0.40:
+            lines.append(f'0.0.0.0 {fqdn}')
+        elif r < 0.75:
+            lines.append(fqdn)
+        elif r < 0.80:
+            lines.append(f'127.0.0.1\t{fqdn.upper()}  # inline comment')
+        elif r < 0.85:
+            lines.append(f'# {fqdn}')
+        elif r < 0.88:
+            lines.append('')
+        elif r < 0.91:
+            lines.append(f'||{fqdn}^')
+        elif r < 0.94:
+            lines.append('.'.join(str(rng.randrange(256)) for _ in range(4)))
+        elif r < 0.97:
+            lines.append(f'::1 {fqdn}.')
+        else:
+            lines.append(f'   {fqdn}   ')
+
+    return ('\r\n' if style == 'mixed' else '\n').join(lines).encode('utf-8') + b'\n'     # noqa: E501
+
+
+#
+def master_csv(urls, seed=0):
+    rng = random.Random(seed)
+
+    rows = []
+    for (index, url) in enumerate(urls):
+        category = rng.choice(CATEGORIES)
+        quality = rng.choice(QUALITIES)
+        rows.append(f'"{category}","{quality}","site{index}","List {index}","{url}"')  # noqa: E501
+
+    return ('\n'.join(rows) + '\n').encode('utf-8')
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+Time the blackhole pipeline offline against synthetic corpora
+
+    python -m benchmarks.run --sizes 10000,100000
+    python -m benchmarks.run --sizes 10000,100000 --save
+
+Results are compared with benchmarks/baseline.json, and any stage slower
+than its baseline by more than --tolerance is reported as a regression.
+Baselines are only meaningful on the machine that recorded them.
+"""
+
+import logging
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import blackhole
+
+from benchmarks import corpus
+from benchmarks.server import serve
+
+
+#
+LOG = logging.getLogger(__name__)
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+DEFAULT_SIZES = [10000, 100000]
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.25
+MASTER_ROWS = 64
+
+
+#
+def best_of(repeat, func, *args):
+    # the fastest of repeat runs, and the result of the last one
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return (best, result)
+
+
+#
+def adjustments(fqdns, seed=0):
+    # a mix of exact, wildcard and regex excludes plus a few includes
+    rng = random.Random(seed)
+    sample = rng.sample(fqdns, min(len(fqdns), max(10, len(fqdns) // 100)))
+
+    excludes = list(sample)
+    excludes.extend(f'*.{tld}' for tld in ('ru', 'cn', 'top'))
+    excludes.extend(f'/{word}[0-9]+\\..*/' for word in corpus.WORDS[:20])
+
+    includes = [corpus.random_fqdn(rng) for _ in range(100)]
+
+    return (blackhole.create_adjustments(includes, allow_regexes=False),
+            blackhole.create_adjustments(excludes, allow_regexes=True))
+
+
+#
+def output_stage(domains, output):
+    blackhole.write_output(output, domains.sorted_keys(), 'unbound')
+
+
+#
+def run(sizes, repeat=DEFAULT_REPEAT):
+    results = {}
+
+    def record(name, size, seconds, lines=None):
+        result = {'seconds': round(seconds, 6)}
+        if lines is not None:
+            result['lines_per_second'] = round(lines / seconds)
+
+        results[f'{name}[{size}]'] = result
+        LOG.info(f'{name}[{size}]:  {seconds:.4f}s')
+
+    for size in sizes:
+        body = corpus.blocklist(size, style='mixed', seed=size)
+        lines = body.count(b'\n')
+
+        files = {'/list.txt': body}
+
+        with serve(files) as base:
+            urls = [f'{base}/list.txt'] * MASTER_ROWS
+            files['/csv.txt'] = corpus.master_csv(urls, seed=size)
+
+            with blackhole.Fetcher() as fetcher:
+                (seconds, _) = best_of(repeat, blackhole.get_masterlist, f'{base}/csv.txt', fetcher)    # noqa: E501
+                record('get_masterlist', size, seconds)
+
+                (seconds, fqdns) = best_of(repeat, blackhole.get_blocklist, f'{base}/list.txt', fetcher)  # noqa: E501
+                record('get_blocklist', size, seconds, lines)
+
+        (seconds, _) = best_of(repeat, blackhole.parser.parse, body)
+        record('parse', size, seconds, lines)
+
+        (seconds, domains) = best_of(repeat, blackhole.DomainSet, fqdns)
+        record('merge', size, seconds)
+
+        (includes, excludes) = adjustments(fqdns, seed=size)
+        (seconds, domains) = best_of(repeat, blackhole.make_adjustments, domains, includes, excludes)   # noqa: E501
+        record('make_adjustments', size, seconds)
+
+        with open(os.devnull, 'w') as output:
+            (seconds, _) = best_of(repeat, output_stage, domains, output)
+        record('output', size, seconds)
+
+    return results
+
+
+#
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    # names of the results slower than their baseline beyond the tolerance
+    regressions = []
+
+    for (name, result) in sorted(results.items()):
+        if name not in baseline:
+            continue
+
+        ratio = result['seconds'] / baseline[name]['seconds']
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+            LOG.error(f'{name} regressed:  {ratio:.2f}x baseline')
+
+    return regressions
+
+
+#
+def main():
+    #
+    argparser = argparse.ArgumentParser(description='Blackhole benchmarks')
+
+    argparser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)))   # noqa: E501
+    argparser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    argparser.add_argument('--baseline', default=BASELINE_PATH)
+    argparser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)   # noqa: E501
+    argparser.add_argument('--save', action='store_true')
+    argparser.add_argument('-o', '--output', type=argparse.FileType('w'), default=sys.stdout)   # noqa: E501
+
+    #
+    args = argparser.parse_args()
+
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+
+    # the corpora contain junk lines on purpose
+    logging.getLogger('blackhole').setLevel(logging.ERROR)
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    results = run(sizes, repeat=args.repeat)
+
+    json.dump(results, args.output, indent=1, sort_keys=True)
+    args.output.write('\n')
+
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+            f.write('\n')
+        exit(0)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+
+    if compare(results, baseline, args.tolerance):
+        exit(1)
+
+    exit(0)
+
+
+if __name__ == '__main__':
+    main()
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Local HTTP stand-in serving generated corpora from memory
+"""
+
+import contextlib
+import hashlib
+import http.server
+import socketserver
+import threading
+
+
+#
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, dict(self.headers)))
+
+        body = server.files.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+
+        etag = server.etag(self.path, body)
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+#
+class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    # http.server.ThreadingHTTPServer only arrived in Python 3.7
+    daemon_threads = True
+
+    def __init__(self, files=None):
+        super().__init__(('127.0.0.1', 0), _Handler)
+
+        # path to body, and the (path, headers) of every request
+        self.files = {} if files is None else files
+        self.requests = []
+        self.url = 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+        self._etags = {}
+        self._thread = None
+
+    #
+    def etag(self, path, body):
+        # hashed once per body, not on every request
+        (hashed, etag) = self._etags.get(path, (None, None))
+        if hashed is not body:
+            etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+            self._etags[path] = (body, etag)
+
+        return etag
+
+    #
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    #
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+#
+@contextlib.contextmanager
+def serve(files):
+    # yields the base URL of a server answering GETs for the paths in files
+    server = Server(files)
+    server.start()
+
+    try:
+        yield server.url
+    finally:
+        server.stop()
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -4,11 +4,35 @@ Retrieve and build a formated blackhole list
 """
 
 import logging
+import collections
+import concurrent.futures
+import contextlib
 import csv
 import enum
 import re
-
-import requests
+import time
+import urllib.parse
+
+from blackhole.cache import HTTPCache    # noqa: F401
+from blackhole import adjcache
+from blackhole.adjcache import AdjustmentCache    # noqa: F401
+from blackhole.fetcher import Fetcher
+from blackhole import parser
+from blackhole import bind    # noqa: F401
+from blackhole.delta import UnboundControl, UnboundControlError    # noqa: F401
+from blackhole.domainset import DomainSet
+from blackhole.extsort import SEPARATOR, sort_key, fqdn_from_key  # noqa: F401
+from blackhole import parsecache
+from blackhole.parsecache import ParseCache    # noqa: F401
+from blackhole.index import Index, InvalidIndexError, write_index    # noqa: F401, E501
+from blackhole.bloom import BloomFilter, InvalidFilterError, write_bloom    # noqa: F401, E501
+from blackhole.publish import atomic_open, publishing    # noqa: F401
+from blackhole import writers    # noqa: F401
+from blackhole.writers import write_output    # noqa: F401
+from blackhole.metrics import Metrics    # noqa: F401
+from blackhole.overlap import Overlap    # noqa: F401
+from blackhole.snapshot import Snapshot, SnapshotWriter, InvalidSnapshotError    # noqa: F401, E501
+from blackhole.matcher import FQDNMatcher, WILDCARD_PREFIX, compile_regexes
 
 
 #
@@ -17,6 +41,9 @@ LOG = logging.getLogger(__name__)
 MASTER_CSV_URL = 'https://v.firebog.net/hosts/csv.txt'
 FIELDNAMES = ['category', 'quality', 'site', 'description', 'url']
 
+DEFAULT_JOBS = 8
+DEFAULT_PER_HOST = 4
+
 
 #
 class Category(enum.Enum):
@@ -50,71 +77,108 @@ class FileRetrieveError(IOError):
 
 
 #
-def get_masterlist(url=MASTER_CSV_URL):
+class DeadlineExceeded(FileRetrieveError):
+    pass
+
+
+#
+@contextlib.contextmanager
+def _fetching(fetcher=None):
+    # use the caller's fetcher, or a short lived one when none was given
+    if fetcher is not None:
+        yield fetcher
+        return
+
+    with Fetcher() as fetcher:
+        yield fetcher
+
+
+#
+def fetch_masterlist(url=MASTER_CSV_URL, fetcher=None):
+    # the master list as downloaded, to be parsed by parse_masterlist()
     LOG.debug(f'Retrieving master list from {url}')
 
-    with requests.Session() as s:
+    # e.g. a pruned copy written by --recommend
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme in ('', 'file'):
         try:
-            handle = s.get(url)
-            content = handle.content.decode('utf-8')
+            with open(parsed.path, 'rb') as f:
+                return f.read()
 
-            reader = csv.DictReader(content.splitlines(), fieldnames=FIELDNAMES)    # noqa: E501
+        except IOError as msg:
+            raise FileRetrieveError(msg)
 
-            master_list = []
-            for row in reader:
-                # make sure a category is present
-                if 'category' not in row:
-                    LOG.warn(f'no category found in {row}')
-                    continue
+    with _fetching(fetcher) as f:
+        try:
+            return f.get(url)
 
-                # convert the row's category to the enum type
-                if row['category'] == 'suspicious':
-                    row['category'] = Category.SUSPICIOUS
-                elif row['category'] == 'advertising':
-                    row['category'] = Category.ADVERTISING
-                elif row['category'] == 'tracking':
-                    row['category'] = Category.TRACKING
-                elif row['category'] == 'malicious':
-                    row['category'] = Category.MALICIOUS
-                elif row['category'] == 'other':
-                    row['category'] = Category.OTHER
-                else:
-                    LOG.warn('Skipping unknown category:  {} in {}'.format(row['category'], row))       # noqa: E501
-                    continue
+        except IOError as msg:
+            raise FileRetrieveError(msg)
 
-                # make sure a quality is present
-                if 'quality' not in row:
-                    LOG.warn(f'no quality found in {row}')
-                    continue
 
-                # convert the row's quality to the enum type
-                if row['quality'] == 'cross':
-                    row['quality'] = Quality.CROSS
-                elif row['quality'] == 'std':
-                    row['quality'] = Quality.STD
-                elif row['quality'] == 'tick':
-                    row['quality'] = Quality.TICK
-                else:
-                    LOG.warn('Skipping unknown quality:  {} in {}'.format(row['quality'], row))     # noqa: E501
-                    continue
+#
+def parse_masterlist(content):
+    content = content.decode('utf-8')
 
-                # make sure a description is present
-                if 'description' not in row:
-                    LOG.warn(f'no description found in {row}')
-                    continue
+    reader = csv.DictReader(content.splitlines(), fieldnames=FIELDNAMES)
 
-                # make sure a url is present
-                if 'url' not in row:
-                    LOG.warn(f'no description found in {row}')
-                    continue
+    master_list = []
+    for row in reader:
+        # make sure a category is present
+        if 'category' not in row:
+            LOG.warn(f'no category found in {row}')
+            continue
 
-                #
-                master_list.append(row)
+        # convert the row's category to the enum type
+        if row['category'] == 'suspicious':
+            row['category'] = Category.SUSPICIOUS
+        elif row['category'] == 'advertising':
+            row['category'] = Category.ADVERTISING
+        elif row['category'] == 'tracking':
+            row['category'] = Category.TRACKING
+        elif row['category'] == 'malicious':
+            row['category'] = Category.MALICIOUS
+        elif row['category'] == 'other':
+            row['category'] = Category.OTHER
+        else:
+            LOG.warn('Skipping unknown category:  {} in {}'.format(row['category'], row))       # noqa: E501
+            continue
 
-        except IOError as msg:
-            raise FileRetrieveError(msg)
+        # make sure a quality is present
+        if 'quality' not in row:
+            LOG.warn(f'no quality found in {row}')
+            continue
+
+        # convert the row's quality to the enum type
+        if row['quality'] == 'cross':
+            row['quality'] = Quality.CROSS
+        elif row['quality'] == 'std':
+            row['quality'] = Quality.STD
+        elif row['quality'] == 'tick':
+            row['quality'] = Quality.TICK
+        else:
+            LOG.warn('Skipping unknown quality:  {} in {}'.format(row['quality'], row))     # noqa: E501
+            continue
+
+        # make sure a description is present
+        if 'description' not in row:
+            LOG.warn(f'no description found in {row}')
+            continue
+
+        # make sure a url is present
+        if 'url' not in row:
+            LOG.warn(f'no description found in {row}')
+            continue
+
+        #
+        master_list.append(row)
+
+    return master_list
 
-        return master_list
+
+#
+def get_masterlist(url=MASTER_CSV_URL, fetcher=None):
+    return parse_masterlist(fetch_masterlist(url, fetcher=fetcher))
 
 
 #
@@ -144,77 +208,229 @@ def filter(master_list, categories=ALL_CATEGORIES, quality=Quality.STD):
 
 
 #
-def get_blocklist(url):
+def get_blocklist(url, fetcher=None, parse_cache=None, executor=None, metrics=None):   # noqa: E501
     LOG.debug(f'Retrieving blocklist from {url}')
 
-    #
-    fqdn_pattern = r'(?P<fqdn>[a-z0-9_-]+(\.[a-z0-9_-]+)*(\.[a-z][a-z0-9_-]*[a-z])\.?)' # noqa: E501
-    ipv4_pattern = r'[0-9]{1,3}(\.[0-9]{1,3}){3}'
-    ipv6_pattern = r'[0-9a-f\:]+'
-    ip_pattern = r'((' + ipv4_pattern + r')|(' + ipv6_pattern + r'))'
-
-    fqdn_re = re.compile(fqdn_pattern, re.I)
-    ip_fqdn_re = re.compile(r'\s+'.join([ip_pattern, fqdn_pattern]), re.I)
+    # only loaded once there is something to download
+    import requests
 
     #
-    with requests.Session() as s:
+    with _fetching(fetcher) as f:
         try:
-            handle = s.get(url)
+            content = f.get(url)
 
-            content = handle.content.decode('utf-8')
+        except requests.exceptions.RequestException as msg:
+            raise FileRetrieveError(msg)
 
-            # prepare regexes
+    # only parse lists whose content has not been seen before
+    start = time.perf_counter()
+    stats = {}
 
-            # process all lines one at a time
-            blocklist = []
-            for line in content.splitlines():
-                # strip off any comments
-                line = line.split('#')[0]
+    if parse_cache is not None:
+        blocklist = parse_cache.parse(url, content, executor=executor, stats=stats)     # noqa: E501
+    else:
+        blocklist = parser.parse(content, executor=executor, stats=stats, source=url)    # noqa: E501
 
-                # strip leading and following whitespace
-                line = line.lstrip().rstrip()
+    if metrics is not None:
+        source = metrics.source(url)
+        source.parse_seconds = time.perf_counter() - start
+        source.parse_cache_hit = stats.get('cached', False)
+        source.lines = stats.get('lines')
+        source.rejected = stats.get('rejected')
+        source.accepted = len(blocklist)
 
-                # ignore blank lines
-                if len(line) == 0:
-                    continue
+    return blocklist
 
-                # ignore comments
-                # if line[0] == '#':
-                #     continue
 
-                # slamcase to lower
-                line = line.lower()
+#
+def stream_blocklist(url, fetcher=None, metrics=None, digest=None, not_modified=None):   # noqa: E501
+    # FQDNs as they are parsed from the response, holding no more than a
+    # chunk of it at a time, digest is updated with every chunk; see
+    # Fetcher.stream() for not_modified
+    LOG.debug(f'Streaming blocklist from {url}')
 
-                # match against FQDN pattern
-                m = fqdn_re.fullmatch(line)
-                if m:
-                    blocklist.append(m.group('fqdn'))
-                    continue
+    import requests
 
-                # match against IP + FQDN pattern
-                m = ip_fqdn_re.fullmatch(line)
-                if m:
-                    blocklist.append(m.group('fqdn'))
-                    continue
+    stats = {}
+
+    def chunks(f):
+        for chunk in f.stream(url, not_modified):
+            if digest is not None:
+                digest.update(chunk)
+            yield chunk
 
-                #
-                LOG.warning(f'no FQDN pattern matched:  {line}')
+    with _fetching(fetcher) as f:
+        try:
+            yield from parser.parse_stream(chunks(f), stats=stats, source=url)
 
         except requests.exceptions.RequestException as msg:
             raise FileRetrieveError(msg)
 
-        #
-        return blocklist
+    if metrics is not None:
+        source = metrics.source(url)
+        source.lines = stats.get('lines')
+        source.rejected = stats.get('rejected')
+
+
+#
+def get_domainset(url, fetcher=None, parse_cache=None, metrics=None):
+    # a compact, deduplicated set of the FQDNs of url, built as they stream
+    digest = parsecache.hasher() if parse_cache is not None else None
+
+    # an unchanged body is the one parsed on the last run that fetched it
+    parsed = None
+
+    def not_modified():
+        nonlocal parsed
+        if parse_cache is not None:
+            parsed = parse_cache.open_last_good(url)
+        return parsed is not None
+
+    domains = DomainSet(stream_blocklist(url, fetcher=fetcher, metrics=metrics, digest=digest, not_modified=not_modified))   # noqa: E501
+
+    if parsed is not None:
+        LOG.debug(f'Using parsed copy of {url}')
+        with parsed:
+            domains.update(line.rstrip(b'\n').decode('ascii') for line in parsed)   # noqa: E501
+    elif parse_cache is not None:
+        parse_cache.record(url, digest.hexdigest(), domains)
+
+    domains.compact()
+
+    if metrics is not None:
+        source = metrics.source(url)
+        source.parse_cache_hit = parsed is not None
+        source.accepted = len(domains)
+
+    return domains
+
+
+#
+def get_blocklists(urls, jobs=DEFAULT_JOBS, per_host=DEFAULT_PER_HOST, fetcher=None, parse_cache=None, executor=None, metrics=None, deadline=None, fallback=None, stream=False):  # noqa: E501
+    assert jobs >= 1
+    assert per_host >= 1
+
+    urls = list(urls)
+
+    # run up to jobs downloads at once, but never more than per_host against
+    # any single host, and hand the results back in the order of urls, as
+    # lists or, streaming, as a DomainSet per url
+    pending = collections.deque(enumerate(urls))
+    inflight = {}
+    active = collections.Counter()
+    finished = {}
+    next_index = 0
+
+    # lists still outstanding at the deadline, a time.monotonic(), fail with
+    # DeadlineExceeded, and with a fallback failed lists are replaced by
+    # whatever fallback(url, error) returns instead of raising
+    def outcome(index):
+        result = finished.pop(index)
+        try:
+            if isinstance(result, FileRetrieveError):
+                raise result
+            return result.result()
+        except FileRetrieveError as msg:
+            if fallback is None:
+                raise
+            return fallback(urls[index], msg)
+
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+    with _fetching(fetcher) as f:
+        try:
+            while pending or inflight:
+                deferred = collections.deque()
+
+                while pending and len(inflight) < jobs:
+                    (index, url) = pending.popleft()
+                    host = urllib.parse.urlsplit(url).hostname
+
+                    if active[host] >= per_host:
+                        deferred.append((index, url))
+                        continue
+
+                    active[host] += 1
+                    if stream:
+                        future = pool.submit(get_domainset, url, fetcher=f, parse_cache=parse_cache, metrics=metrics)   # noqa: E501
+                    else:
+                        future = pool.submit(get_blocklist, url, fetcher=f, parse_cache=parse_cache, executor=executor, metrics=metrics)   # noqa: E501
+                    inflight[future] = (index, host)
+
+                deferred.extend(pending)
+                pending = deferred
+
+                timeout = None
+                if deadline is not None:
+                    timeout = max(0.0, deadline - time.monotonic())
+
+                (done, _) = concurrent.futures.wait(inflight, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)  # noqa: E501
+
+                for future in done:
+                    (index, host) = inflight.pop(future)
+                    active[host] -= 1
+                    finished[index] = future
+
+                if deadline is not None and time.monotonic() >= deadline:
+                    for (index, _) in list(inflight.values()) + list(pending):
+                        finished[index] = DeadlineExceeded(f'{urls[index]} was not retrieved before the deadline')   # noqa: E501
+                    inflight = {}
+                    pending = collections.deque()
+
+                # without a fallback a failed download raises here, leaving
+                # the rest unscheduled
+                while next_index in finished:
+                    yield (urls[next_index], outcome(next_index))
+                    next_index += 1
+
+        finally:
+            # no more than jobs downloads are ever submitted, so nothing is
+            # queued, and those still running past the deadline are abandoned
+            pool.shutdown(wait=deadline is None)
 
 
 #
-def create_adjustments(adjustments, allow_regexes=True):
+def create_adjustments(adjustments, allow_regexes=True, cache=None):
+    # with an AdjustmentCache, @files are compiled once and reused until
+    # they change
+    return _create_adjustments(adjustments, allow_regexes, cache, {})
+
+
+#
+def _file_adjustments(path, allow_regexes, cache, files):
+    if cache is not None:
+        cached = cache.load(path, allow_regexes)
+        if cached is not None:
+            (fqdns, patterns, nfiles) = cached
+            files.update(nfiles)
+
+            (_, regexes) = _create_adjustments(patterns, allow_regexes, None, {})   # noqa: E501
+            return (fqdns, regexes)
+
+    # the stamp is taken first so that a file changing while it is read is
+    # compiled again next time
+    nfiles = {path: adjcache.file_stamp(path)}
+
+    with open(path, 'r') as f:
+        lines = [line.strip() for line in f]
+
+    entries = [line for line in lines if line and not line.startswith('#')]
+    (fqdns, regexes) = _create_adjustments(entries, allow_regexes, cache, nfiles)   # noqa: E501
+
+    if cache is not None:
+        cache.store(path, allow_regexes, sorted(fqdns), [adj for (adj, _) in regexes], nfiles)   # noqa: E501
+
+    files.update(nfiles)
+    return (fqdns, regexes)
+
+
+#
+def _create_adjustments(adjustments, allow_regexes, cache, files):
     assert isinstance(adjustments, (tuple, list))
     for adj in adjustments:
         assert isinstance(adj, str)
 
     #
-    fqdn_pattern = r'(?P<fqdn>[a-z0-9_-]+(\.[a-z0-9_-]+)*(\.[a-z][a-z0-9_-]*[a-z])\.?)' # noqa: E501
+    fqdn_pattern = r'(?P<fqdn>[a-z0-9_-]+(\.[a-z0-9_-]+)*(\.[a-z][a-z0-9_-]*[a-z])\.?)'  # noqa: E501
     fqdn_re = re.compile(fqdn_pattern, re.I)
 
     #
@@ -223,12 +439,9 @@ def create_adjustments(adjustments, allow_regexes=True):
 
     for adj in adjustments:
         if adj[0] == '@':
-            with open(adj[1:], 'r') as f:
-                more_adjs = f.readlines()
+            (nfqdns, nregexes) = _file_adjustments(adj[1:], allow_regexes, cache, files)   # noqa: E501
 
-            (nfqdns, nregexes) = create_adjustments(more_adjs)
-
-            fqdns = fqdns.union(nfqdns)
+            fqdns.update(nfqdns)
             regexes.extend(nregexes)
 
         elif allow_regexes and adj.find('/') != -1:
@@ -256,6 +469,15 @@ def create_adjustments(adjustments, allow_regexes=True):
 
             regexes.append((adj, adj_re))
 
+        elif allow_regexes and adj.startswith(WILDCARD_PREFIX):
+            # *.example.com matches every subdomain of example.com
+            m = fqdn_re.fullmatch(adj[len(WILDCARD_PREFIX):])
+            if not m:
+                LOG.warning(f'skipping malformed wildcard adjustment:  {adj}')      # noqa: E501
+                continue
+
+            fqdns.add(adj.lower())
+
         else:
             m = fqdn_re.fullmatch(adj)
             if not m:
@@ -276,37 +498,55 @@ def make_adjustments(fqdns, includes=None, excludes=None):
     assert isinstance(excludes, (tuple, list))
     assert len(excludes) == 2
 
-    nfqdns = set()
-
-    # process excludes
     (efqdns, eregexes) = excludes
-    for fqdn in fqdns:
-        skip = False
+    fqdn_matcher = FQDNMatcher(efqdns)
+    regex_engine = compile_regexes(eregexes) if len(eregexes) > 0 else None
 
-        # check static FQDNs first
-        for efqdn in efqdns:
-            if fqdn == efqdn:
-                skip = True
-                break
+    if isinstance(fqdns, DomainSet):
+        # stream the sorted store into a new one rather than expanding it
+        def excluded(fqdn):
+            if fqdn in fqdn_matcher:
+                return True
+            return regex_engine is not None and regex_engine.match(fqdn) is not None  # noqa: E501
 
-        # check regex FQDNs next
-        for eregex in eregexes:
-            (pattern, compiled_re) = eregex
+        nfqdns = fqdns.filter(excluded)
 
-            m = compiled_re.fullmatch(fqdn)
-            if m:
-                skip = True
-                break
+    else:
+        # process excludes, static and wildcard FQDNs first
+        nfqdns = fqdn_matcher.filter(fqdns)
 
-        if not skip:
-            nfqdns.add(fqdn)
+        # check regex FQDNs next, all at once
+        if regex_engine is not None:
+            nfqdns = regex_engine.filter(nfqdns)
 
     # process includes
     (ifqdns, _) = includes
-    for ifqdn in ifqdns:
-        nfqdns.add(ifqdn)
+    nfqdns.update(ifqdns)
 
     #
     return nfqdns
 
+
+#
+def collapse(keys, stats=None):
+    # keys are reversed-label sort keys in sorted order, so every subdomain of
+    # a name follows it directly and is dropped while it extends its key
+    kept = 0
+    removed = 0
+
+    prefix = None
+    for key in keys:
+        if prefix is not None and key.startswith(prefix):
+            removed += 1
+            continue
+
+        prefix = key + SEPARATOR
+        kept += 1
+
+        yield key
+
+    if stats is not None:
+        stats['kept'] = kept
+        stats['removed'] = removed
+
 # vim:sw=4:ts=4:et:fenc=utf-8:
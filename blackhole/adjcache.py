@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of compiled @file adjustments keyed by the files they came from
+"""
+
+import logging
+import hashlib
+import json
+import os
+
+from blackhole.publish import atomic_open
+
+
+#
+LOG = logging.getLogger(__name__)
+
+SUFFIX = '.adj'
+
+# bump when the stored layout or the meaning of an adjustment changes
+VERSION = 1
+
+
+#
+def file_stamp(path):
+    # what must still hold for a compiled file to be reused
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+#
+class AdjustmentCache:
+    # each entry is one line of JSON naming the files it was compiled from,
+    # with their stamps, and the regex adjustments, followed by the FQDNs
+    def __init__(self, directory):
+        self.directory = directory
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    #
+    def _path(self, path, allow_regexes):
+        key = f'{os.path.abspath(path)}\0{allow_regexes}'.encode('utf-8')
+        return os.path.join(self.directory, hashlib.sha256(key).hexdigest() + SUFFIX)    # noqa: E501
+
+    #
+    def load(self, path, allow_regexes):
+        # (fqdns, regex adjustments, files), or None if any file has changed
+        try:
+            with open(self._path(path, allow_regexes), 'rb') as f:
+                meta = json.loads(f.readline())
+                data = f.read()
+        except (IOError, ValueError):
+            return None
+
+        if meta.get('version') != VERSION:
+            return None
+
+        files = meta['files']
+        try:
+            if any(file_stamp(name) != stamp for (name, stamp) in files.items()):   # noqa: E501
+                return None
+        except IOError:
+            return None
+
+        fqdns = data.decode('utf-8').split('\n') if data else []
+
+        LOG.debug(f'Using compiled adjustments for {path}')
+        return (fqdns, meta['regexes'], files)
+
+    #
+    def store(self, path, allow_regexes, fqdns, regexes, files):
+        meta = {'version': VERSION, 'files': files, 'regexes': regexes}
+
+        with atomic_open(self._path(path, allow_regexes), 'wb') as f:
+            f.write(json.dumps(meta).encode('utf-8') + b'\n')
+            f.write('\n'.join(fqdns).encode('utf-8'))
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+BIND Response Policy Zone output
+
+named builds the IXFR journal itself when the zone has
+`ixfr-from-differences yes;` and is reloaded after each build.
+"""
+
+import logging
+import itertools
+import os
+import re
+import time
+
+
+#
+LOG = logging.getLogger(__name__)
+
+DEFAULT_ORIGIN = 'rpz.blackhole.'
+DEFAULT_TTL = 300
+DEFAULT_NAMESERVER = 'localhost.'
+DEFAULT_HOSTMASTER = 'hostmaster.localhost.'
+
+# SOA refresh, retry, expire and negative caching TTL
+DEFAULT_TIMERS = (3600, 600, 604800, DEFAULT_TTL)
+
+# the SOA record is among the first lines of a zone
+HEADER_LINES = 8
+
+_SERIAL_RE = re.compile(r'^@\s+IN\s+SOA\s+\S+\s+\S+\s+(?P<serial>\d+)\s')
+
+
+#
+def owner_names(fqdn, subdomains=True):
+    # RPZ triggers on exact names, so subdomains need a wildcard of their own
+    fqdn = fqdn.rstrip('.')
+
+    yield fqdn
+    if subdomains:
+        yield f'*.{fqdn}'
+
+
+#
+def zone_serial(zone_path):
+    # the SOA serial of a zone file written earlier, or None
+    if zone_path is None or not os.path.isfile(zone_path):
+        return None
+
+    with open(zone_path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in itertools.islice(f, HEADER_LINES):
+            m = _SERIAL_RE.match(line)
+            if m:
+                return int(m.group('serial'))
+
+    return None
+
+
+#
+def next_serial(previous=None):
+    # seconds since the epoch, but always past the previous serial, so that
+    # named and its secondaries take the zone as newer
+    serial = int(time.time())
+
+    if previous is not None and previous >= serial:
+        serial = previous + 1
+
+    return serial % 2**32
+
+
+#
+def zone_header(serial, origin=DEFAULT_ORIGIN, ttl=DEFAULT_TTL):
+    (refresh, retry, expire, minimum) = DEFAULT_TIMERS
+
+    return (f'$TTL {ttl}\n'
+            f'$ORIGIN {origin}\n'
+            f'@ IN SOA {DEFAULT_NAMESERVER} {DEFAULT_HOSTMASTER} {serial} {refresh} {retry} {expire} {minimum}\n'   # noqa: E501
+            f'@ IN NS {DEFAULT_NAMESERVER}\n')
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
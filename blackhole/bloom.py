@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Bloom filter export of blocked FQDNs for clients that cannot hold the list
+
+The file is a header followed by the bit array, simple enough to read from
+any language:
+
+    magic       8 bytes     b'BHBLOOM1'
+    bits        uint64 LE   size m of the bit array
+    count       uint64 LE   FQDNs added
+    hashes      uint32 LE   probes k per FQDN
+    reserved    uint32 LE
+    array       m / 8 bytes bit j is (array[j >> 3] >> (j & 7)) & 1
+
+A name is the lower cased FQDN without a trailing dot.  Its 16 byte BLAKE2b
+digest gives h1 from the first and h2 from the last 8 bytes as little endian
+integers, h2 made odd, and probe i tests bit (h1 + i * h2) mod m.
+"""
+
+import logging
+import hashlib
+import math
+import struct
+
+from blackhole.publish import atomic_open
+
+
+#
+LOG = logging.getLogger(__name__)
+
+MAGIC = b'BHBLOOM1'
+
+_HEADER = struct.Struct('<8sQQII')
+
+DEFAULT_FALSE_POSITIVE_RATE = 0.001
+
+
+#
+class InvalidFilterError(ValueError):
+    pass
+
+
+#
+def parameters(count, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE):
+    # the optimal bit count m and probe count k for count FQDNs
+    if not 0 < false_positive_rate < 1:
+        raise ValueError(f'false positive rate must be between 0 and 1, not {false_positive_rate}')    # noqa: E501
+
+    count = max(count, 1)
+
+    bits = math.ceil(-count * math.log(false_positive_rate) / math.log(2) ** 2)    # noqa: E501
+    bits = max(64, (bits + 63) // 64 * 64)
+    hashes = max(1, round(bits / count * math.log(2)))
+
+    return (bits, hashes)
+
+
+#
+def _hashes(name):
+    digest = hashlib.blake2b(name.encode('utf-8'), digest_size=16).digest()
+
+    return (int.from_bytes(digest[:8], 'little'),
+            int.from_bytes(digest[8:], 'little') | 1)
+
+
+#
+class BloomFilter:
+    __slots__ = ('bits', 'hashes', 'count', 'array')
+
+    def __init__(self, bits, hashes, count=0, array=None):
+        self.bits = bits
+        self.hashes = hashes
+        self.count = count
+        self.array = bytearray(bits // 8) if array is None else array
+
+    #
+    @classmethod
+    def for_capacity(cls, count, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE):  # noqa: E501
+        return cls(*parameters(count, false_positive_rate))
+
+    #
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        try:
+            (magic, bits, count, hashes, _) = _HEADER.unpack_from(data)
+        except struct.error:
+            magic = None
+
+        if magic != MAGIC:
+            raise InvalidFilterError(f'{path} is not a blackhole Bloom filter')   # noqa: E501
+
+        array = data[_HEADER.size:]
+        if len(array) != bits // 8:
+            raise InvalidFilterError(f'{path} is truncated')
+
+        return cls(bits, hashes, count, array)
+
+    #
+    def save(self, path):
+        # replaced atomically, clients may read the file at any time
+        with atomic_open(path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, self.bits, self.count, self.hashes, 0))   # noqa: E501
+            f.write(self.array)
+
+    #
+    def add(self, fqdn):
+        (h1, h2) = _hashes(fqdn.lower().rstrip('.'))
+        (array, bits) = (self.array, self.bits)
+
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % bits
+            array[bit >> 3] |= 1 << (bit & 7)
+
+        self.count += 1
+
+    #
+    def update(self, fqdns):
+        for fqdn in fqdns:
+            self.add(fqdn)
+
+    #
+    def _test(self, name):
+        (h1, h2) = _hashes(name)
+        (array, bits) = (self.array, self.bits)
+
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % bits
+            if not array[bit >> 3] & (1 << (bit & 7)):
+                return False
+
+        return True
+
+    #
+    def __contains__(self, fqdn):
+        # exact test, false positives at about the configured rate
+        return self._test(fqdn.lower().rstrip('.'))
+
+    #
+    def match(self, fqdn):
+        # the name or parent domain that tests positive, the chance of a
+        # false positive grows with the number of labels tested
+        labels = fqdn.lower().rstrip('.').split('.')
+
+        for start in range(len(labels)):
+            name = '.'.join(labels[start:])
+            if self._test(name):
+                return name
+
+        return None
+
+    #
+    def blocked(self, fqdn):
+        return self.match(fqdn) is not None
+
+    #
+    def false_positive_rate(self):
+        # the expected rate for an exact test at the current fill
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes    # noqa: E501
+
+
+#
+def write_bloom(path, fqdns, count, false_positive_rate=DEFAULT_FALSE_POSITIVE_RATE):    # noqa: E501
+    # count is an upper bound on the FQDNs, sizing the filter up front
+    bloom = BloomFilter.for_capacity(count, false_positive_rate)
+    bloom.update(fqdns)
+    bloom.save(path)
+
+    return bloom
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk HTTP cache keyed by URL, revalidated with ETag / If-Modified-Since
+"""
+
+import logging
+import contextlib
+import hashlib
+import json
+import os
+
+from blackhole.publish import atomic_open
+
+
+#
+LOG = logging.getLogger(__name__)
+
+
+#
+class HTTPCache:
+    def __init__(self, directory):
+        self.directory = directory
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    #
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+        body_path = os.path.join(self.directory, f'{key}.body')
+        meta_path = os.path.join(self.directory, f'{key}.json')
+
+        return (body_path, meta_path)
+
+    #
+    def _write(self, path, data):
+        with atomic_open(path, 'wb') as f:
+            f.write(data)
+
+    #
+    def load_meta(self, url):
+        (body_path, meta_path) = self._paths(url)
+
+        if not os.path.exists(body_path):
+            return None
+
+        try:
+            with open(meta_path, 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return None
+
+    #
+    def open(self, url):
+        # the cached body as a file to stream from, or None
+        (body_path, _) = self._paths(url)
+
+        try:
+            return open(body_path, 'rb')
+        except IOError:
+            return None
+
+    #
+    def load(self, url):
+        f = self.open(url)
+        if f is None:
+            return None
+
+        with f:
+            return f.read()
+
+    #
+    @contextlib.contextmanager
+    def writer(self, url, etag=None, last_modified=None):
+        # a file to stream a body into, stored only once it is complete
+        (body_path, meta_path) = self._paths(url)
+
+        meta = {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+        }
+
+        with atomic_open(body_path, 'wb') as f:
+            yield f
+
+        self._write(meta_path, json.dumps(meta).encode('utf-8'))
+
+    #
+    def store(self, url, content, etag=None, last_modified=None):
+        with self.writer(url, etag=etag, last_modified=last_modified) as f:
+            f.write(content)
+
+    #
+    def validators(self, url):
+        meta = self.load_meta(url)
+        if meta is None:
+            return {}
+
+        headers = {}
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+        return headers
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -5,9 +5,102 @@ Retrieve and build a formated blackhole list
 
 import logging
 import argparse
+import json
+import os
+import shlex
+import signal
+import subprocess
 import sys
+import tempfile
+import time
 
 import blackhole
+import blackhole.daemon
+
+
+#
+def run_daemon(args, fetcher, categories, quality, includes, excludes):
+    #
+    log = logging.getLogger(__name__)
+
+    if args.debug == 0:
+        logging.basicConfig(stream=sys.stderr, level=logging.WARNING if args.silent else logging.INFO)  # noqa: E501
+
+    executor = None
+    if args.parse_workers > 1:
+        executor = blackhole.parser.create_executor(args.parse_workers)
+
+    # adjust, write and publish the merged set whenever a source changed
+    def build(domains):
+        domains = blackhole.make_adjustments(domains, includes, excludes)
+
+        def emitted():
+            keys = domains.sorted_keys()
+            if args.collapse:
+                keys = blackhole.collapse(keys)
+            return keys
+
+        serial = None
+        if args.format == 'bind':
+            serial = blackhole.bind.next_serial(blackhole.bind.zone_serial(args.publish))   # noqa: E501
+
+        with blackhole.publishing(args.publish) as output:
+            blackhole.write_output(output, emitted(), args.format, compress=args.gzip, serial=serial, origin=args.rpz_origin)   # noqa: E501
+
+        if args.index is not None:
+            blackhole.write_index(args.index, emitted(), directory=args.tmpdir)    # noqa: E501
+
+        if args.bloom is not None:
+            blackhole.write_bloom(args.bloom, map(blackhole.fqdn_from_key, emitted()), len(domains), args.bloom_fp_rate)   # noqa: E501
+
+        log.info(f'Published {len(domains)} FQDNs to {args.publish}')
+        domains.close()
+
+        # e.g. unbound-control reload
+        if args.on_change is not None:
+            result = subprocess.run(shlex.split(args.on_change))
+            if result.returncode != 0:
+                log.error(f'"{args.on_change}" exited with {result.returncode}')    # noqa: E501
+
+    refresher = blackhole.daemon.Refresher(args.url, categories, quality, build, fetcher,      # noqa: E501
+                                           interval=args.refresh_interval,
+                                           max_interval=4 * args.refresh_interval,     # noqa: E501
+                                           jobs=args.jobs, executor=executor)
+
+    signal.signal(signal.SIGTERM, lambda *_: refresher.stop())
+    signal.signal(signal.SIGINT, lambda *_: refresher.stop())
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, lambda *_: refresher.refresh_all())
+
+    try:
+        refresher.run()
+    finally:
+        fetcher.close()
+        if executor is not None:
+            executor.shutdown()
+
+
+#
+def print_overlap(report, limit=10):
+    sources = report['sources']
+    print(f'{len(sources)} lists, {report["union"]} FQDNs between them ({report["method"]})')   # noqa: E501
+
+    print(f'{"FQDNs":>10} {"unique":>10}  list')
+    for (url, source) in sorted(sources.items(), key=lambda item: -item[1]['unique']):   # noqa: E501
+        print(f'{source["size"]:>10} {source["unique"]:>10}  {url}')
+
+    if report['pairs']:
+        print('Most similar lists:')
+        print(f'{"Jaccard":>10} {"shared":>10}  lists')
+        for pair in report['pairs'][:limit]:
+            print(f'{pair["jaccard"]:>10.3f} {pair["shared"]:>10}  {"  ".join(pair["sources"])}')    # noqa: E501
+
+    # the coverage reached by the lists chosen, which overshoots the target
+    recommended = report['recommended']
+    covered = recommended[-1]['coverage'] if recommended else 0.0
+    print(f'{len(recommended)} of {len(sources)} lists cover {covered:.1%} of the FQDNs, for a target of {report["coverage"]:.1%}:')   # noqa: E501
+    for entry in recommended:
+        print(f'{entry["coverage"]:>10.2%}  {entry["url"]}')
 
 
 #
@@ -24,14 +117,59 @@ def main():
 
     argparser.add_argument('-u', '--url', default=blackhole.MASTER_CSV_URL)
 
+    argparser.add_argument('--cache-dir', default=None)
+    argparser.add_argument('--timeout', type=float, default=blackhole.fetcher.DEFAULT_TIMEOUT[1])      # noqa: E501
+    argparser.add_argument('--retries', type=int, default=blackhole.fetcher.DEFAULT_RETRIES)          # noqa: E501
+    argparser.add_argument('--source-timeout', type=float, default=None)
+    argparser.add_argument('--deadline', type=float, default=None)
+
     argparser.add_argument('-c', '--category', nargs='*', default=[])
     argparser.add_argument('-q', '--quality', choices=['tick', 'std', 'cross'], default='tick')     # noqa: E501
 
+    argparser.add_argument('-j', '--jobs', type=int, default=blackhole.DEFAULT_JOBS)             # noqa: E501
+    argparser.add_argument('--parse-workers', type=int, default=os.cpu_count() or 1)   # noqa: E501
+    argparser.add_argument('--per-host', type=int, default=blackhole.DEFAULT_PER_HOST)           # noqa: E501
+    argparser.add_argument('--stream', action='store_true')
+
     argparser.add_argument('-i', '--includes', nargs='*', default=[])
     argparser.add_argument('-e', '--excludes', nargs='*', default=[])
 
-    argparser.add_argument('-f', '--format', choices=['unbound', 'bind', 'text'], default='text')   # noqa: E501
-    argparser.add_argument('-o', '--output', type=argparse.FileType('w'), default=sys.stdout)       # noqa: E501
+    argparser.add_argument('--collapse', action='store_true')
+    argparser.add_argument('--sort-memory', type=int, default=blackhole.extsort.DEFAULT_MAX_MEMORY // 2**20)   # noqa: E501
+    argparser.add_argument('--tmpdir', default=None)
+
+    argparser.add_argument('-f', '--format', choices=blackhole.writers.formats(), default='text')   # noqa: E501
+    argparser.add_argument('--gzip', action='store_true')
+    argparser.add_argument('--rpz-origin', default=blackhole.bind.DEFAULT_ORIGIN)    # noqa: E501
+
+    argparser.add_argument('--index', default=None)
+    argparser.add_argument('--bloom', default=None)
+    argparser.add_argument('--bloom-fp-rate', type=float, default=blackhole.bloom.DEFAULT_FALSE_POSITIVE_RATE)   # noqa: E501
+
+    argparser.add_argument('--state', default=None)
+    argparser.add_argument('--delta-add', default=None)
+    argparser.add_argument('--delta-remove', default=None)
+    argparser.add_argument('--apply', action='store_true')
+    argparser.add_argument('--unbound-control', default=' '.join(blackhole.delta.DEFAULT_UNBOUND_CONTROL))    # noqa: E501
+
+    argparser.add_argument('--snapshot', default=None)
+    argparser.add_argument('--from-snapshot', '--offline', dest='from_snapshot', default=None)   # noqa: E501
+
+    argparser.add_argument('--analyze', action='store_true')
+    argparser.add_argument('--overlap-method', choices=blackhole.overlap.METHODS, default=blackhole.overlap.DEFAULT_METHOD)   # noqa: E501
+    argparser.add_argument('--coverage', type=float, default=blackhole.overlap.DEFAULT_COVERAGE)   # noqa: E501
+    argparser.add_argument('--analyze-json', default=None)
+    argparser.add_argument('--recommend', default=None)
+
+    argparser.add_argument('--metrics-json', default=None)
+    argparser.add_argument('--metrics-prom', default=None)
+
+    argparser.add_argument('-o', '--output', default='-')
+    argparser.add_argument('--publish', default=None)
+
+    argparser.add_argument('--daemon', action='store_true')
+    argparser.add_argument('--refresh-interval', type=float, default=blackhole.daemon.DEFAULT_INTERVAL)   # noqa: E501
+    argparser.add_argument('--on-change', default=None)
 
     #
     args = argparser.parse_args()
@@ -41,6 +179,62 @@ def main():
         logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
         log.debug('Debug logging enabled')
 
+    if args.apply and args.state is None:
+        log.error('--apply needs --state to compute what changed')
+        exit(-1)
+
+    # a parent domain only stands in for its subdomains where it blocks them
+    if args.collapse and not blackhole.writers.covers_subdomains(args.format):
+        log.error(f'--collapse would leave subdomains unblocked in the {args.format} format')   # noqa: E501
+        exit(-1)
+
+    if not args.rpz_origin.endswith('.'):
+        args.rpz_origin += '.'
+
+    # an output file is replaced atomically, like a published one
+    if args.publish is None and args.output != '-':
+        args.publish = args.output
+
+    if args.daemon and args.publish is None:
+        log.error('--daemon needs --publish for the file it keeps up to date')
+        exit(-1)
+
+    if args.daemon and args.state is not None:
+        log.error('--state is not supported with --daemon')
+        exit(-1)
+
+    if args.daemon and args.from_snapshot is not None:
+        log.error('--from-snapshot is not supported with --daemon')
+        exit(-1)
+
+    if (args.analyze_json is not None or args.recommend is not None) and not args.analyze:  # noqa: E501
+        log.error('--analyze-json and --recommend need --analyze')
+        exit(-1)
+
+    if args.daemon and args.analyze:
+        log.error('--analyze is not supported with --daemon')
+        exit(-1)
+
+    if not 0 < args.coverage <= 1:
+        log.error('--coverage must be above 0 and at most 1')
+        exit(-1)
+
+    if args.daemon and args.deadline is not None:
+        log.error('--deadline is not supported with --daemon, use --source-timeout')  # noqa: E501
+        exit(-1)
+
+    if args.refresh_interval <= 0:
+        log.error('--refresh-interval must be positive')
+        exit(-1)
+
+    if not 0 < args.bloom_fp_rate < 1:
+        log.error('--bloom-fp-rate must be between 0 and 1')
+        exit(-1)
+
+    if args.jobs < 1 or args.per_host < 1 or args.parse_workers < 1:
+        log.error('--jobs, --per-host and --parse-workers must be at least 1')
+        exit(-1)
+
     # convert categories from strings to enums
     if len(args.category) == 0:
         categories = blackhole.ALL_CATEGORIES
@@ -72,65 +266,373 @@ def main():
         log.error('Unknown quality:  {}'.format(args.quality))
         exit(-1)
 
+    # timings and counters are always gathered, per-FQDN attribution only
+    # when they are exported
+    started = time.time()
+    metrics = blackhole.Metrics(directory=args.tmpdir)
+    export_metrics = args.metrics_json is not None or args.metrics_prom is not None   # noqa: E501
+
+    # reuse previously downloaded lists when they have not changed, their
+    # parsed FQDNs when their content has not changed, and compiled @files
+    # when the files have not changed
+    cache = None
+    parse_cache = None
+    adjustment_cache = None
+    if args.cache_dir is not None:
+        cache = blackhole.HTTPCache(os.path.join(args.cache_dir, 'http'))
+        parse_cache = blackhole.ParseCache(os.path.join(args.cache_dir, 'parsed'))    # noqa: E501
+        adjustment_cache = blackhole.AdjustmentCache(os.path.join(args.cache_dir, 'adjustments'))    # noqa: E501
+
     # preprocess includes and excludes
-    includes = blackhole.create_adjustments(args.includes, allow_regexes=False)
-    excludes = blackhole.create_adjustments(args.excludes, allow_regexes=True)
+    try:
+        includes = blackhole.create_adjustments(args.includes, allow_regexes=False, cache=adjustment_cache)   # noqa: E501
+        excludes = blackhole.create_adjustments(args.excludes, allow_regexes=True, cache=adjustment_cache)    # noqa: E501
+    except IOError as msg:
+        log.error(f'Could not read adjustments:  {msg}')
+        exit(-1)
+
+    # every download finishes within --source-timeout seconds, and all of
+    # them within --deadline seconds of the start
+    deadline = None
+    if args.deadline is not None:
+        deadline = time.monotonic() + args.deadline
+
+    # a snapshot bundle stands in for the network, which is never touched
+    snapshot = None
+    fetcher = None
+    if args.from_snapshot is not None:
+        try:
+            snapshot = blackhole.Snapshot(args.from_snapshot)
+        except (IOError, ValueError) as msg:
+            log.error(f'Could not open the snapshot "{args.from_snapshot}":  {msg}')  # noqa: E501
+            exit(-1)
+
+    # one pooled session for every download
+    else:
+        timeout = (blackhole.fetcher.DEFAULT_TIMEOUT[0], args.timeout)
+        pool_size = max(args.jobs, blackhole.fetcher.DEFAULT_POOL_SIZE)
+        fetcher = blackhole.Fetcher(cache=cache, timeout=timeout, retries=args.retries, pool_size=pool_size, metrics=metrics,   # noqa: E501
+                                    max_time=args.source_timeout, deadline=deadline)   # noqa: E501
+
+    # keep refreshing in the foreground until SIGTERM
+    if args.daemon:
+        run_daemon(args, fetcher, categories, quality, includes, excludes)
+        exit(0)
 
     # Download the Master List
-    if not args.silent:
+    if snapshot is not None:
+        args.url = snapshot.url
+        if not args.silent:
+            print(f'Building from the snapshot of {args.url} taken {time.strftime("%Y-%m-%d %H:%M:%S %Z", time.localtime(snapshot.created))}')   # noqa: E501
+    elif not args.silent:
         print(f'Downloading master list from {args.url}')
 
     try:
-        master_list = blackhole.get_masterlist(args.url)
-    except blackhole.FileRetrieveError as msg:
+        if snapshot is not None:
+            master = snapshot.master()
+        else:
+            master = blackhole.fetch_masterlist(args.url, fetcher=fetcher)
+        master_list = blackhole.parse_masterlist(master)
+    except (blackhole.FileRetrieveError, blackhole.InvalidSnapshotError) as msg:  # noqa: E501
         log.error(f'Could not retrieve master file "{args.url}":  {msg}')
         exit(-1)
 
+    # the master list and every list retrieved, as parsed, are bundled up
+    # to build from later with --from-snapshot
+    bundle = None
+    if args.snapshot is not None:
+        try:
+            bundle = blackhole.SnapshotWriter(args.snapshot, args.url, master)
+        except IOError as msg:
+            log.error(f'Could not write the snapshot "{args.snapshot}":  {msg}')   # noqa: E501
+            exit(-1)
+
     # Filter down to the specified types of FQDN lists
     filtered_list = blackhole.filter(master_list, categories=categories, quality=quality)   # noqa: E501
 
-    #
-    fqdns = set()
+    # FQDNs are held in a compact sorted store, spilled to --tmpdir past
+    # --sort-memory MiB
+    fqdns = blackhole.DomainSet(max_memory=args.sort_memory * 2**20, directory=args.tmpdir)    # noqa: E501
+
+    # large lists are parsed across several processes, unless each is
+    # streamed straight into a compact set of its own
+    executor = None
+    if args.parse_workers > 1 and not args.stream:
+        executor = blackhole.parser.create_executor(args.parse_workers)
+
+    # lists that fail or miss the deadline fall back to the copy parsed on
+    # the last run that retrieved them, or are left out
+    stale = []
+    failed = []
+
+    def fallback(url, msg):
+        blocklist = None
+        if parse_cache is not None:
+            blocklist = parse_cache.last_good(url)
+
+        if blocklist is None:
+            log.error(f'Could not retrieve file "{url}":  {msg}')
+            failed.append(url)
+            return None
+
+        log.warning(f'Using the last good copy of "{url}":  {msg}')
+        metrics.source(url).stale = True
+        stale.append(url)
+
+        return blocklist
+
+    def from_snapshot(urls):
+        for url in urls:
+            try:
+                blocklist = snapshot.source(url)
+            except blackhole.InvalidSnapshotError as msg:
+                blocklist = None
+                log.error(f'Could not read "{url}" from the snapshot:  {msg}')   # noqa: E501
+            else:
+                if blocklist is None:
+                    log.error(f'"{url}" is not in the snapshot')
+                else:
+                    metrics.source(url).accepted = len(blocklist)
+
+            if blocklist is None:
+                failed.append(url)
+
+            yield (url, blocklist)
+
+    # instead of building, --analyze measures how much each list adds
+    overlap = None
+    if args.analyze:
+        overlap = blackhole.Overlap(args.overlap_method)
+
+    # Retrieve all of the FQDNs, several lists at a time
+    urls = [row['url'] for row in filtered_list]
+    merged = set()
+    if snapshot is not None:
+        blocklists = from_snapshot(urls)
+    else:
+        blocklists = blackhole.get_blocklists(urls, jobs=args.jobs, per_host=args.per_host, fetcher=fetcher, parse_cache=parse_cache, executor=executor, metrics=metrics,    # noqa: E501
+                                              deadline=deadline, fallback=fallback, stream=args.stream)   # noqa: E501
 
-    # Retrieve all of the FQDNs
     for row in filtered_list:
         description = row['description']
         url = row['url']
 
+        # the wall-clock time spent waiting on the lists
+        with metrics.phase('fetch'):
+            (_, blocklist) = next(blocklists)
+        if blocklist is None:
+            continue
+
+        if not args.silent and url not in stale:
+            print(f'{"Loaded" if snapshot is not None else "Downloaded"} {url}:  {description}')  # noqa: E501
+
+        if bundle is not None:
+            try:
+                bundle.add_source(url, blocklist)
+            except IOError as msg:
+                log.error(f'Could not write the snapshot "{args.snapshot}":  {msg}')   # noqa: E501
+                bundle.abort()
+                exit(-1)
+
+        if overlap is not None:
+            with metrics.phase('analyze'):
+                overlap.add(url, blocklist)
+
+            if isinstance(blocklist, blackhole.DomainSet):
+                blocklist.close()
+            continue
+
+        # byte-identical mirrors only need merging once
+        digest = None
+        if snapshot is not None:
+            digest = snapshot.digest(url)
+        elif parse_cache is not None:
+            digest = parse_cache.digests[url]
+
+        if digest is not None:
+            if digest in merged:
+                log.debug(f'Skipping {url}, identical to an earlier list')
+                continue
+            merged.add(digest)
+
+        with metrics.phase('merge'):
+            fqdns.update(blocklist)
+            if export_metrics:
+                metrics.record_contribution(url, blocklist)
+
+        if isinstance(blocklist, blackhole.DomainSet):
+            blocklist.close()
+
+    if fetcher is not None:
+        fetcher.close()
+    if snapshot is not None:
+        snapshot.close()
+    if executor is not None:
+        executor.shutdown()
+
+    if filtered_list and len(failed) == len(filtered_list):
+        log.error('Could not retrieve any of the lists')
+        if bundle is not None:
+            bundle.abort()
+        exit(-1)
+
+    if bundle is not None:
+        try:
+            bundle.close()
+        except IOError as msg:
+            log.error(f'Could not write the snapshot "{args.snapshot}":  {msg}')   # noqa: E501
+            exit(-1)
+
+        if not args.silent:
+            print(f'Wrote a snapshot of {len(bundle.manifest["sources"])} lists to {args.snapshot}')   # noqa: E501
+
+    # report the overlap between the lists, and which of them are needed
+    if overlap is not None:
+        with metrics.phase('analyze'):
+            report = overlap.report(args.coverage)
+
         if not args.silent:
-            print(f'Downloading {url}:  {description}')
+            print_overlap(report)
 
         try:
-            for fqdn in blackhole.get_blocklist(url):
-                if fqdn not in fqdns:
-                    fqdns.add(fqdn)
-        except blackhole.FileRetrieveError as msg:
-            log.error(f'Could not retrieve file "{url}":  {msg}')
+            if args.analyze_json is not None:
+                with blackhole.atomic_open(args.analyze_json) as f:
+                    json.dump(report, f, indent=1)
+                    f.write('\n')
+
+            # a master list of just those, to build from with --url
+            if args.recommend is not None:
+                with blackhole.atomic_open(args.recommend, 'wb') as f:
+                    f.write(blackhole.overlap.prune_masterlist(master, (entry['url'] for entry in report['recommended'])))   # noqa: E501
+        except IOError as msg:
+            log.error(f'Could not write the analysis:  {msg}')
             exit(-1)
 
+        exit(0)
+
+    if (stale or failed) and not args.silent:
+        print(f'{len(stale)} lists used their last good copy and {len(failed)} were left out')   # noqa: E501
+
+    if parse_cache is not None:
+        parse_cache.save()
+
     # process includes and excludes
-    fqdns = blackhole.make_adjustments(fqdns, includes, excludes)
+    with metrics.phase('adjust'):
+        fqdns = blackhole.make_adjustments(fqdns, includes, excludes)
+
+    with metrics.phase('sort'):
+        fqdns.compact()
+
+    # the store is already in reversed-label order, optionally dropping
+    # FQDNs covered by a blocked parent domain
+    def emitted(stats=None):
+        keys = fqdns.sorted_keys()
+        if args.collapse:
+            keys = blackhole.collapse(keys, stats)
+        return keys
+
+    # a response policy zone carries a serial newer than the published one
+    serial = None
+    if args.format == 'bind':
+        serial = blackhole.bind.next_serial(blackhole.bind.zone_serial(args.publish))   # noqa: E501
+
+    # print the FQDNs in the specified format, or publish them atomically
+    collapse_stats = {}
+    try:
+        with metrics.phase('write'), blackhole.publishing(args.publish, sys.stdout) as output:    # noqa: E501
+            blackhole.write_output(output, emitted(collapse_stats), args.format, compress=args.gzip, serial=serial, origin=args.rpz_origin)  # noqa: E501
+    except IOError as msg:
+        log.error(f'Could not publish "{args.publish}":  {msg}')
+        exit(-1)
 
-    # sort and print the FQDNs in the specified format
-    rfqdns = [fqdn.split('.')[::-1] for fqdn in fqdns]
+    if args.collapse and not args.silent:
+        print('Collapsed {removed} FQDNs covered by a parent domain, {kept} remain'.format(**collapse_stats))  # noqa: E501
 
-    for rfqdn in sorted(rfqdns):
-        fqdn = '.'.join(rfqdn[::-1])
+    # a memory-mapped index for lookups from resolvers and log analysis
+    if args.index is not None:
+        try:
+            with metrics.phase('index'):
+                count = blackhole.write_index(args.index, emitted(), directory=args.tmpdir)   # noqa: E501
+        except IOError as msg:
+            log.error(f'Could not write the index "{args.index}":  {msg}')
+            exit(-1)
 
-        if args.format == 'unbound':
-            args.output.write(f'local-zone: "{fqdn}" static\n')
+        if not args.silent:
+            print(f'Indexed {count} FQDNs in {args.index}')
 
-        elif args.format == 'bind':
-            log.error('bind output format not implemented')
+    # a compact probabilistic filter for clients that cannot hold the list
+    if args.bloom is not None:
+        try:
+            with metrics.phase('bloom'):
+                bloom = blackhole.write_bloom(args.bloom, map(blackhole.fqdn_from_key, emitted()), len(fqdns), args.bloom_fp_rate)   # noqa: E501
+        except IOError as msg:
+            log.error(f'Could not write the Bloom filter "{args.bloom}":  {msg}')   # noqa: E501
             exit(-1)
 
-        elif args.format == 'text':
-            args.output.write(f'{fqdn}\n')
+        if not args.silent:
+            print(f'Wrote a {bloom.bits // 8} byte Bloom filter of {bloom.count} FQDNs to {args.bloom}')   # noqa: E501
+
+    # work out what changed since the state of the previous run.  While any
+    # list is left out, the FQDNs of the previous state stay, in unbound and
+    # in the state, as they may be that list's, and only additions go out
+    if args.state is not None:
+        def current():
+            if failed:
+                return blackhole.delta.union(blackhole.delta.read_state(args.state), emitted())   # noqa: E501
+            return emitted()
+
+        def delta_file(path):
+            if path is None:
+                return tempfile.TemporaryFile('w+', encoding='utf-8')
+            return open(path, 'w+', encoding='utf-8')
 
-        else:
-            log.error(f'Unknown output format:  {args.format}')
+        try:
+            with delta_file(args.delta_add) as add_file, delta_file(args.delta_remove) as remove_file:     # noqa: E501
+                old_keys = blackhole.delta.read_state(args.state)
+                (added, removed) = blackhole.delta.write_delta(old_keys, current(), add_file, remove_file)  # noqa: E501
+
+                if not args.silent:
+                    print(f'{added} FQDNs added and {removed} removed since the last run')    # noqa: E501
+
+                # push the changes into the running unbound in batches
+                if args.apply:
+                    control = blackhole.UnboundControl(shlex.split(args.unbound_control))  # noqa: E501
+
+                    remove_file.seek(0)
+                    control.remove(line.rstrip('\n') for line in remove_file)  # noqa: E501
+
+                    add_file.seek(0)
+                    control.add(line.rstrip('\n') for line in add_file)
+
+        except (IOError, ValueError) as msg:
+            log.error(f'Could not update from the state in "{args.state}":  {msg}')   # noqa: E501
             exit(-1)
 
+        blackhole.delta.write_state(args.state, current())
+
+    # export the build's metrics, e.g. for the node_exporter textfile collector
+    if export_metrics:
+        metrics.totals['fqdns'] = len(fqdns)
+        metrics.totals['sources'] = len(filtered_list)
+        metrics.totals['stale_sources'] = len(stale)
+        metrics.totals['failed_sources'] = len(failed)
+        metrics.totals['build_seconds'] = time.time() - started
+        metrics.finish()
+
+        try:
+            if args.metrics_json is not None:
+                metrics.save(args.metrics_json)
+            if args.metrics_prom is not None:
+                metrics.save(args.metrics_prom, prometheus=True)
+        except IOError as msg:
+            log.error(f'Could not write metrics:  {msg}')
+            exit(-1)
+
+    # removals wait for every list, so a list that keeps failing must be seen
+    if failed and args.state is not None:
+        log.error(f'Kept the FQDNs of "{args.state}" that may belong to the {len(failed)} lists left out')   # noqa: E501
+        exit(-1)
+
     #
     exit(0)
 
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Long running refresh of the master list and its blocklists, rebuilding the
+merged set only when a source has changed
+"""
+
+import logging
+import concurrent.futures
+import heapq
+import random
+import threading
+import time
+
+import blackhole
+from blackhole import parser
+from blackhole.domainset import DomainSet
+from blackhole.parsecache import digest
+
+
+#
+LOG = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 3600.0
+DEFAULT_MAX_INTERVAL = 4 * DEFAULT_INTERVAL
+DEFAULT_RETRY_INTERVAL = 60.0
+DEFAULT_JITTER = 0.1
+
+
+#
+class Source:
+    __slots__ = ('url', 'description', 'domains', 'digest', 'interval', 'due',
+                 'failures')
+
+    def __init__(self, url, description, interval, due):
+        self.url = url
+        self.description = description
+
+        # the last good parse of the list, kept while downloads fail
+        self.domains = None
+        self.digest = None
+
+        self.interval = interval
+        self.due = due
+        self.failures = 0
+
+
+#
+class Refresher:
+    def __init__(self, url, categories, quality, build, fetcher,
+                 interval=DEFAULT_INTERVAL, max_interval=DEFAULT_MAX_INTERVAL,
+                 retry_interval=DEFAULT_RETRY_INTERVAL, jitter=DEFAULT_JITTER,
+                 jobs=blackhole.DEFAULT_JOBS, executor=None,
+                 clock=time.monotonic, rng=None):
+        self.url = url
+        self.categories = categories
+        self.quality = quality
+
+        # called with the merged DomainSet whenever it has changed
+        self.build = build
+
+        self.fetcher = fetcher
+        self.executor = executor
+        self.jobs = jobs
+
+        self.interval = interval
+        self.max_interval = max_interval
+        self.retry_interval = retry_interval
+        self.jitter = jitter
+
+        self.clock = clock
+        self.rng = random.Random() if rng is None else rng
+
+        self.sources = {}
+        self.master_due = clock()
+        self.master_failures = 0
+
+        self.domains = None
+        self.changed = False
+
+        self.wakeup = threading.Event()
+        self.stopping = False
+
+    #
+    def _after(self, interval):
+        # spread refreshes so that sources on one host do not line up
+        return self.clock() + interval * self.rng.uniform(1 - self.jitter, 1 + self.jitter)   # noqa: E501
+
+    #
+    def _backoff(self, failures):
+        return min(self.max_interval, self.retry_interval * 2 ** (failures - 1))  # noqa: E501
+
+    #
+    def refresh_master(self):
+        try:
+            master_list = blackhole.get_masterlist(self.url, fetcher=self.fetcher)   # noqa: E501
+        except blackhole.FileRetrieveError as msg:
+            self.master_failures += 1
+            self.master_due = self._after(self._backoff(self.master_failures))
+            LOG.error(f'Could not retrieve master file "{self.url}":  {msg}')
+            return
+
+        self.master_failures = 0
+        self.master_due = self._after(self.interval)
+
+        rows = blackhole.filter(master_list, categories=self.categories, quality=self.quality)   # noqa: E501
+        urls = {row['url']: row['description'] for row in rows}
+
+        for url in list(self.sources):
+            if url not in urls:
+                LOG.info(f'Dropping {url}, no longer in the master list')
+                del self.sources[url]
+                self.changed = True
+
+        for (url, description) in urls.items():
+            if url not in self.sources:
+                LOG.info(f'Adding {url}:  {description}')
+                self.sources[url] = Source(url, description, self.interval, self.clock())  # noqa: E501
+
+    #
+    def refresh_sources(self, sources):
+        # download concurrently, but only parse the lists that changed
+        def fetch(source):
+            try:
+                return (source, self.fetcher.get(source.url), None)
+            except IOError as msg:
+                return (source, None, msg)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.jobs) as pool:  # noqa: E501
+            for (source, content, error) in pool.map(fetch, sources):
+                if error is not None:
+                    source.failures += 1
+                    source.due = self._after(self._backoff(source.failures))
+                    LOG.error(f'Could not retrieve file "{source.url}":  {error}')   # noqa: E501
+                    continue
+
+                source.failures = 0
+
+                key = digest(content)
+                if key == source.digest:
+                    # unchanged lists are checked less and less often
+                    source.interval = min(self.max_interval, source.interval * 2)   # noqa: E501
+                    source.due = self._after(source.interval)
+                    LOG.debug(f'Unchanged {source.url}')
+                    continue
+
+                fqdns = parser.parse(content, executor=self.executor, source=source.url)    # noqa: E501
+
+                domains = DomainSet(fqdns)
+                domains.compact()
+
+                if source.domains is not None:
+                    source.domains.close()
+
+                source.domains = domains
+                source.digest = key
+                source.interval = self.interval
+                source.due = self._after(source.interval)
+                self.changed = True
+
+                LOG.info(f'Refreshed {source.url}:  {len(domains)} FQDNs')
+
+    #
+    def merge(self):
+        # the sources are each sorted already, so merging is a single pass
+        keys = heapq.merge(*(source.domains.keys() for source in self.sources.values() if source.domains is not None))  # noqa: E501
+
+        if self.domains is not None:
+            self.domains.close()
+
+        self.domains = DomainSet.from_sorted_keys(keys)
+        return self.domains
+
+    #
+    def poll(self):
+        # one round of whatever refreshes are due, true if a build was made
+        if self.master_due <= self.clock():
+            self.refresh_master()
+
+        # lists new to the master list are due straight away
+        now = self.clock()
+        due = [source for source in self.sources.values() if source.due <= now]  # noqa: E501
+        if due:
+            self.refresh_sources(due)
+
+        if not self.changed:
+            return False
+
+        # a failed build is tried again on the next poll
+        self.build(self.merge())
+        self.changed = False
+
+        return True
+
+    #
+    def next_due(self):
+        return min([self.master_due] + [source.due for source in self.sources.values()])   # noqa: E501
+
+    #
+    def refresh_all(self):
+        # e.g. on SIGHUP, everything is due straight away
+        now = self.clock()
+
+        self.master_due = now
+        for source in self.sources.values():
+            source.due = now
+
+        self.wakeup.set()
+
+    #
+    def stop(self):
+        self.stopping = True
+        self.wakeup.set()
+
+    #
+    def run(self):
+        while not self.stopping:
+            try:
+                self.poll()
+                timeout = max(0.0, self.next_due() - self.clock())
+            except Exception:
+                # a failed build leaves the published output in place and is
+                # tried again shortly
+                LOG.exception('Refresh failed')
+                timeout = self.retry_interval
+            LOG.debug(f'Sleeping {timeout:.0f}s until the next refresh')
+
+            self.wakeup.wait(timeout)
+            self.wakeup.clear()
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
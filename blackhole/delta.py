@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Differences between successive builds, applied live through unbound-control
+"""
+
+import logging
+import heapq
+import itertools
+import os
+import subprocess
+
+from blackhole.extsort import sort_key, fqdn_from_key
+from blackhole.publish import atomic_open
+
+
+#
+LOG = logging.getLogger(__name__)
+
+DEFAULT_UNBOUND_CONTROL = ['unbound-control']
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_ZONE_TYPE = 'static'
+
+
+#
+class UnboundControlError(IOError):
+    pass
+
+
+#
+def read_state(path):
+    # the sort keys of a previously written state file, in order
+    if not os.path.exists(path):
+        return
+
+    previous = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            key = sort_key(line.rstrip('\n'))
+
+            if previous is not None and key <= previous:
+                raise ValueError(f'state file {path} is not sorted at {line!r}')    # noqa: E501
+            previous = key
+
+            yield key
+
+
+#
+def write_state(path, keys):
+    # replace the state file atomically with the FQDNs of keys
+    with atomic_open(path) as f:
+        f.writelines(f'{fqdn_from_key(key)}\n' for key in keys)
+
+
+#
+def diff(old_keys, new_keys):
+    # merge two sorted key streams into ('+', key) and ('-', key) changes
+    old_keys = iter(old_keys)
+    new_keys = iter(new_keys)
+
+    old = next(old_keys, None)
+    new = next(new_keys, None)
+
+    while old is not None or new is not None:
+        if new is None or (old is not None and old < new):
+            yield ('-', old)
+            old = next(old_keys, None)
+        elif old is None or new < old:
+            yield ('+', new)
+            new = next(new_keys, None)
+        else:
+            old = next(old_keys, None)
+            new = next(new_keys, None)
+
+
+#
+def union(old_keys, new_keys):
+    # the keys of both sorted streams, in order and each once
+    for (key, _) in itertools.groupby(heapq.merge(old_keys, new_keys)):
+        yield key
+
+
+#
+def write_delta(old_keys, new_keys, add_file, remove_file):
+    # write the FQDNs to add and to remove one per line, returning the counts
+    added = 0
+    removed = 0
+
+    for (change, key) in diff(old_keys, new_keys):
+        if change == '+':
+            add_file.write(f'{fqdn_from_key(key)}\n')
+            added += 1
+        else:
+            remove_file.write(f'{fqdn_from_key(key)}\n')
+            removed += 1
+
+    return (added, removed)
+
+
+#
+class UnboundControl:
+    def __init__(self, command=DEFAULT_UNBOUND_CONTROL,
+                 batch_size=DEFAULT_BATCH_SIZE, zone_type=DEFAULT_ZONE_TYPE):
+        self.command = list(command)
+        self.batch_size = batch_size
+        self.zone_type = zone_type
+
+    #
+    def _run(self, subcommand, lines):
+        count = 0
+
+        lines = iter(lines)
+        while True:
+            batch = list(itertools.islice(lines, self.batch_size))
+            if len(batch) == 0:
+                break
+
+            LOG.debug(f'unbound-control {subcommand} with {len(batch)} lines')
+
+            try:
+                result = subprocess.run(self.command + [subcommand],
+                                        input=''.join(batch).encode('utf-8'),
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+            except OSError as msg:
+                raise UnboundControlError(msg)
+
+            output = result.stdout.decode('utf-8', 'replace').strip()
+            if result.returncode != 0 or output.startswith('error'):
+                stderr = result.stderr.decode('utf-8', 'replace').strip()
+                raise UnboundControlError(f'{subcommand} failed:  {output} {stderr}')   # noqa: E501
+
+            count += len(batch)
+
+        return count
+
+    #
+    def add(self, fqdns):
+        return self._run('local_zones', (f'{fqdn} {self.zone_type}\n' for fqdn in fqdns))    # noqa: E501
+
+    #
+    def remove(self, fqdns):
+        return self._run('local_zones_remove', (f'{fqdn}\n' for fqdn in fqdns))    # noqa: E501
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
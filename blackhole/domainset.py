@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+Compact, sorted store for large sets of FQDNs
+"""
+
+import logging
+import array
+import heapq
+import mmap
+import tempfile
+
+from blackhole.extsort import sort_key, fqdn_from_key
+
+
+#
+LOG = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 256 * 1024
+
+# offsets written at a time by a segment spilled to disk
+SPILL_BATCH = 64 * 1024
+
+# heap taken by an FQDN waiting to be sorted, as a str in a set and then as
+# its encoded key
+PENDING_BYTES = 256
+
+
+#
+def _encode(fqdn):
+    return sort_key(fqdn).encode('utf-8')
+
+
+#
+def _decode(key):
+    return fqdn_from_key(key.decode('utf-8'))
+
+
+#
+def _unique(keys):
+    previous = None
+    for key in keys:
+        if key != previous:
+            yield key
+        previous = key
+
+
+#
+class _Segment:
+    # sorted, unique keys packed end to end in one buffer and found through
+    # an array of offsets, about len(key) + 4 bytes per FQDN
+    __slots__ = ('blob', 'offsets', 'file', 'index', '_index_map')
+
+    def __init__(self, keys, size_hint=0, directory=None, spill=False):
+        self.file = None
+        self.index = None
+        self._index_map = None
+
+        if spill:
+            self._spill(keys, directory)
+            return
+
+        self.offsets = array.array('I' if size_hint < 2**32 else 'Q')
+
+        blob = bytearray()
+        for key in keys:
+            self._append_offset(len(blob))
+            blob += key
+        self._append_offset(len(blob))
+
+        self.blob = blob
+
+    #
+    def _spill(self, keys, directory):
+        # stream the keys, and their offsets, to the page cache as they come
+        # instead of building either on the heap
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.index = tempfile.TemporaryFile(dir=directory)
+
+        offsets = array.array('Q', [0])
+        position = 0
+
+        for key in keys:
+            self.file.write(key)
+            position += len(key)
+            offsets.append(position)
+
+            if len(offsets) >= SPILL_BATCH:
+                offsets.tofile(self.index)
+                del offsets[:]
+
+        offsets.tofile(self.index)
+
+        if position == 0:
+            # nothing to map, an empty segment is kept on the heap
+            self.file.close()
+            self.index.close()
+            (self.file, self.index) = (None, None)
+            (self.blob, self.offsets) = (bytearray(), array.array('I', [0]))
+            return
+
+        self.file.flush()
+        self.index.flush()
+
+        self.blob = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._index_map = mmap.mmap(self.index.fileno(), 0, access=mmap.ACCESS_READ)   # noqa: E501
+        self.offsets = memoryview(self._index_map).cast('Q')
+
+    #
+    def _append_offset(self, offset):
+        try:
+            self.offsets.append(offset)
+        except OverflowError:
+            self.offsets = array.array('Q', self.offsets)
+            self.offsets.append(offset)
+
+    #
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    #
+    def nbytes(self):
+        # the heap memory held, a spilled segment lives in the page cache
+        if self.file is not None:
+            return 0
+
+        return self.offsets.itemsize * len(self.offsets) + len(self.blob)
+
+    #
+    def close(self):
+        if self.file is not None:
+            # the view of the offsets must be released before their map
+            self.offsets.release()
+            self._index_map.close()
+            self.blob.close()
+
+            self.index.close()
+            self.file.close()
+
+    #
+    def key(self, index):
+        return bytes(self.blob[self.offsets[index]:self.offsets[index + 1]])
+
+    #
+    def keys(self):
+        blob = self.blob
+        offsets = self.offsets
+
+        for index in range(len(offsets) - 1):
+            yield bytes(blob[offsets[index]:offsets[index + 1]])
+
+    #
+    def __contains__(self, key):
+        (lo, hi) = (0, len(self))
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo < len(self) and self.key(lo) == key
+
+
+#
+class DomainSet:
+    __slots__ = ('_pending', '_segments', 'buffer_size', 'max_memory',
+                 'directory')
+
+    def __init__(self, fqdns=(), buffer_size=DEFAULT_BUFFER_SIZE,
+                 max_memory=None, directory=None):
+        self._pending = set()
+        self._segments = []
+
+        # the FQDNs waiting to be sorted count against the budget too
+        if max_memory is not None:
+            buffer_size = max(1, min(buffer_size, max_memory // PENDING_BYTES))   # noqa: E501
+
+        self.buffer_size = buffer_size
+        self.max_memory = max_memory
+        self.directory = directory
+
+        self.update(fqdns)
+
+    #
+    @classmethod
+    def from_sorted_keys(cls, keys, **kwargs):
+        # keys are encoded sort keys already in order, as yielded by keys()
+        domains = cls(**kwargs)
+        domains._add_segment(_unique(keys))
+
+        return domains
+
+    #
+    def add(self, fqdn):
+        self._pending.add(fqdn)
+
+        if len(self._pending) >= self.buffer_size:
+            self._flush()
+
+    #
+    def update(self, fqdns):
+        # another DomainSet is taken over as sorted keys, not decoded FQDNs
+        if isinstance(fqdns, DomainSet):
+            size_hint = sum(len(segment.blob) for segment in fqdns._segments)
+            self._add_segment(fqdns.keys(), size_hint)
+            return
+
+        for fqdn in fqdns:
+            self._pending.add(fqdn)
+
+            if len(self._pending) >= self.buffer_size:
+                self._flush()
+
+    #
+    def __contains__(self, fqdn):
+        if fqdn in self._pending:
+            return True
+
+        key = _encode(fqdn)
+        for segment in self._segments:
+            if key in segment:
+                return True
+
+        return False
+
+    #
+    def __len__(self):
+        self.compact()
+
+        if len(self._segments) == 0:
+            return 0
+
+        return len(self._segments[0])
+
+    #
+    def __iter__(self):
+        for key in self.keys():
+            yield _decode(key)
+
+    #
+    def nbytes(self):
+        return sum(segment.nbytes() for segment in self._segments)
+
+    #
+    def keys(self):
+        # the encoded sort keys of every FQDN, unique and in sorted order
+        pending = sorted(map(_encode, self._pending))
+        sources = [segment.keys() for segment in self._segments]
+
+        return _unique(heapq.merge(pending, *sources))
+
+    #
+    def sorted_keys(self):
+        # the same keys as str, as accepted by collapse() and fqdn_from_key()
+        for key in self.keys():
+            yield key.decode('utf-8')
+
+    #
+    def filter(self, excluded):
+        # a new DomainSet without the FQDNs for which excluded() is true
+        keys = (key for key in self.keys() if not excluded(_decode(key)))
+        size_hint = sum(len(segment.blob) for segment in self._segments)
+
+        domains = DomainSet(buffer_size=self.buffer_size,
+                            max_memory=self.max_memory,
+                            directory=self.directory)
+        domains._add_segment(keys, size_hint)
+
+        return domains
+
+    #
+    def compact(self):
+        self._flush()
+
+        if len(self._segments) > 1:
+            self._merge(len(self._segments))
+
+    #
+    def close(self):
+        for segment in self._segments:
+            segment.close()
+
+        self._segments = []
+        self._pending = set()
+
+    #
+    def _add_segment(self, keys, size_hint=0, held=0):
+        # held is the heap of segments being merged, alive until it is done
+        spill = self.max_memory is not None and self.nbytes() + held + size_hint > self.max_memory     # noqa: E501
+
+        segment = _Segment(keys, size_hint, self.directory, spill)
+        self._segments.append(segment)
+
+        # merge neighbours of similar size so there are only log(n) segments
+        count = 1
+        while count < len(self._segments) and \
+                len(self._segments[-count - 1]) <= 2 * len(self._segments[-1]):     # noqa: E501
+            count += 1
+
+        if count > 1:
+            self._merge(count)
+
+    #
+    def _flush(self):
+        if len(self._pending) == 0:
+            return
+
+        keys = sorted(map(_encode, self._pending))
+        size_hint = sum(map(len, keys))
+        self._pending = set()
+
+        self._add_segment(keys, size_hint)
+
+    #
+    def _merge(self, count):
+        segments = self._segments[-count:]
+        del self._segments[-count:]
+
+        size_hint = sum(len(segment.blob) for segment in segments)
+        held = sum(segment.nbytes() for segment in segments)
+        keys = _unique(heapq.merge(*[segment.keys() for segment in segments]))
+
+        self._add_segment(keys, size_hint, held)
+
+        for segment in segments:
+            segment.close()
+
+        LOG.debug(f'Merged {count} segments into one of {len(self._segments[-1])} keys')    # noqa: E501
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
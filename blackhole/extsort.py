@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+Reversed-label sort keys of FQDNs, as kept by DomainSet
+"""
+
+import logging
+
+
+#
+LOG = logging.getLogger(__name__)
+
+# joins the reversed labels of a sort key, it sorts before every character
+# that may appear in a label so keys sort exactly like lists of labels
+SEPARATOR = '\0'
+
+# heap a DomainSet may hold before it spills to disk, see --sort-memory
+DEFAULT_MAX_MEMORY = 256 * 1024 * 1024
+
+
+#
+def sort_key(fqdn):
+    return SEPARATOR.join(fqdn.split('.')[::-1])
+
+
+#
+def fqdn_from_key(key):
+    return '.'.join(key.split(SEPARATOR)[::-1])
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+Shared, pooled HTTP fetcher used for the master list and every blocklist
+"""
+
+import logging
+import contextlib
+import functools
+import time
+
+
+#
+LOG = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = (10.0, 60.0)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_POOL_SIZE = 16
+
+CHUNK_SIZE = 64 * 1024
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# requests is only imported once a Fetcher is made, so that builds from a
+# snapshot never load it
+
+
+#
+class Fetcher:
+    def __init__(self, cache=None, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 pool_size=DEFAULT_POOL_SIZE, session=None, metrics=None,
+                 max_time=None, deadline=None):
+        self.cache = cache
+        self.timeout = timeout
+        self.metrics = metrics
+
+        # seconds any one download may take in total, and a time.monotonic()
+        # by which every download must have finished
+        self.max_time = max_time
+        self.deadline = deadline
+
+        import requests
+
+        if session is None:
+            import requests.adapters
+            import urllib3.util.retry
+
+            session = requests.Session()
+
+            retry = urllib3.util.retry.Retry(total=retries,
+                                             backoff_factor=backoff,
+                                             status_forcelist=RETRY_STATUSES)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,    # noqa: E501
+                                                    pool_maxsize=pool_size,
+                                                    max_retries=retry)
+
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+        session.headers['Accept-Encoding'] = 'gzip, deflate'
+
+        self.session = session
+        self._timeout_error = requests.exceptions.Timeout
+
+    #
+    def __enter__(self):
+        return self
+
+    #
+    def __exit__(self, *exc_info):
+        self.close()
+
+    #
+    def close(self):
+        self.session.close()
+
+    #
+    def _open(self, url, headers=None):
+        # a streamed response, and a check that the time limits still hold
+        start = time.monotonic()
+
+        ends = [start + self.max_time] if self.max_time is not None else []
+        if self.deadline is not None:
+            ends.append(self.deadline)
+        end = min(ends) if ends else None
+
+        # the timeouts only bound each connect and read, so a server that
+        # trickles its body is cut off while it is streamed
+        def check():
+            if end is not None and time.monotonic() >= end:
+                raise self._timeout_error(f'{url} took longer than {end - start:.1f}s')   # noqa: E501
+
+        check()
+
+        # nor may a server that sends nothing outlast the time left
+        timeout = self.timeout
+        if end is not None:
+            if not isinstance(timeout, tuple):
+                timeout = (timeout, timeout)
+
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise self._timeout_error(f'{url} took longer than {end - start:.1f}s')   # noqa: E501
+
+            timeout = tuple(remaining if t is None else min(t, remaining) for t in timeout)  # noqa: E501
+
+        handle = self.session.get(url, headers=headers, timeout=timeout, stream=True)   # noqa: E501
+
+        return (handle, check)
+
+    #
+    def _chunks(self, handle, check):
+        with handle:
+            for chunk in handle.iter_content(CHUNK_SIZE):
+                check()
+                yield chunk
+
+    #
+    def _get(self, url, headers=None):
+        (handle, check) = self._open(url, headers)
+        return (handle, b''.join(self._chunks(handle, check)))
+
+    #
+    def stream(self, url, not_modified=None):
+        # the body of url in chunks of about CHUNK_SIZE bytes, as they arrive
+        # or from the cache, with a fresh download written through to it;
+        # the cached body is skipped if not_modified() returns true for it
+        start = time.perf_counter()
+        size = 0
+
+        headers = self.cache.validators(url) if self.cache is not None else None   # noqa: E501
+        (handle, check) = self._open(url, headers)
+
+        cached = None
+        if handle.status_code == 304:
+            handle.close()
+
+            cached = self.cache.open(url)
+            if cached is None:
+                # the cached body went missing, fetch it again unconditionally
+                (handle, check) = self._open(url)
+
+        if cached is not None:
+            with cached:
+                if not_modified is None or not not_modified():
+                    LOG.debug(f'Not modified, streaming cached copy of {url}')   # noqa: E501
+                    yield from iter(functools.partial(cached.read, CHUNK_SIZE), b'')   # noqa: E501
+
+        else:
+            # error pages are never mistaken for a list
+            try:
+                handle.raise_for_status()
+            except BaseException:
+                handle.close()
+                raise
+
+            with contextlib.ExitStack() as stack:
+                f = None
+                if self.cache is not None and handle.status_code == 200:
+                    f = stack.enter_context(self.cache.writer(url, etag=handle.headers.get('ETag'),                  # noqa: E501
+                                                              last_modified=handle.headers.get('Last-Modified')))   # noqa: E501
+
+                for chunk in self._chunks(handle, check):
+                    if f is not None:
+                        f.write(chunk)
+                    size += len(chunk)
+                    yield chunk
+
+        # the time includes whatever the consumer did between chunks
+        if self.metrics is not None:
+            source = self.metrics.source(url)
+            source.download_seconds = time.perf_counter() - start
+            source.status = handle.status_code if cached is None else 304
+            source.cache_hit = cached is not None
+            source.bytes = size
+
+    #
+    def get(self, url):
+        start = time.perf_counter()
+
+        (content, status, cache_hit) = self._fetch(url)
+
+        if self.metrics is not None:
+            source = self.metrics.source(url)
+            source.download_seconds = time.perf_counter() - start
+            source.status = status
+            source.cache_hit = cache_hit
+            source.bytes = 0 if cache_hit else len(content)
+
+        return content
+
+    #
+    def _fetch(self, url):
+        # error pages are never mistaken for a list
+        if self.cache is None:
+            (handle, content) = self._get(url)
+            handle.raise_for_status()
+            return (content, handle.status_code, False)
+
+        (handle, content) = self._get(url, headers=self.cache.validators(url))   # noqa: E501
+
+        if handle.status_code == 304:
+            content = self.cache.load(url)
+            if content is not None:
+                LOG.debug(f'Not modified, using cached copy of {url}')
+                return (content, handle.status_code, True)
+
+            # the cached body went missing, fetch it again unconditionally
+            (handle, content) = self._get(url)
+
+        handle.raise_for_status()
+
+        if handle.status_code == 200:
+            self.cache.store(url, content,
+                             etag=handle.headers.get('ETag'),
+                             last_modified=handle.headers.get('Last-Modified'))    # noqa: E501
+
+        return (content, handle.status_code, False)
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
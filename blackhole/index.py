@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Memory-mapped lookup index of blocked FQDNs, queried without loading it
+
+The file holds a header, an array of count + 1 offsets and the reversed-label
+sort keys of every FQDN packed end to end in sorted order, so that a query is
+a handful of binary searches over the mapped pages.
+"""
+
+import logging
+import array
+import heapq
+import mmap
+import shutil
+import struct
+import sys
+import tempfile
+
+from blackhole.extsort import SEPARATOR, sort_key, fqdn_from_key
+from blackhole.publish import atomic_open
+
+
+#
+LOG = logging.getLogger(__name__)
+
+MAGIC = b'BHINDEX1'
+
+# magic, byte order of the offsets, key count
+_HEADER = struct.Struct('<8s8sQ')
+
+_BYTEORDER = sys.byteorder.encode('ascii').ljust(8, b'\0')
+
+_SEPARATOR = SEPARATOR.encode('ascii')
+
+
+#
+class InvalidIndexError(ValueError):
+    pass
+
+
+#
+def _normalized_keys(keys):
+    # a trailing dot leaves an empty first label, those keys sort first and
+    # are folded in with the rest once the dot is dropped
+    keys = iter(keys)
+    dotted = []
+
+    for key in keys:
+        if not key.startswith(SEPARATOR):
+            keys = heapq.merge(sorted(dotted), [key], keys)
+            break
+        dotted.append(key.lstrip(SEPARATOR))
+    else:
+        keys = sorted(dotted)
+
+    previous = None
+    for key in keys:
+        if key != previous:
+            yield key
+        previous = key
+
+
+#
+def write_index(path, keys, directory=None):
+    # keys are str sort keys in sorted order, as yielded by collapse() or
+    # DomainSet.sorted_keys(), the index is replaced atomically
+    offsets = array.array('Q', [0])
+
+    with tempfile.TemporaryFile(dir=directory) as blob:
+        position = 0
+        for key in _normalized_keys(keys):
+            data = key.encode('utf-8')
+            blob.write(data)
+            position += len(data)
+            offsets.append(position)
+
+        blob.seek(0)
+
+        with atomic_open(path, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, _BYTEORDER, len(offsets) - 1))
+            offsets.tofile(f)
+            shutil.copyfileobj(blob, f)
+
+    return len(offsets) - 1
+
+
+#
+class Index:
+    __slots__ = ('path', '_file', '_map', '_offsets', '_start', '_count')
+
+    def __init__(self, path):
+        self.path = path
+
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)    # noqa: E501
+        except ValueError:
+            self._file.close()
+            raise InvalidIndexError(f'{path} is not a blackhole index')
+
+        try:
+            (magic, byteorder, count) = _HEADER.unpack_from(self._map)
+        except struct.error:
+            magic = None
+
+        if magic != MAGIC:
+            self.close()
+            raise InvalidIndexError(f'{path} is not a blackhole index')
+
+        if byteorder != _BYTEORDER:
+            self.close()
+            raise InvalidIndexError(f'{path} was written with another byte order')   # noqa: E501
+
+        start = _HEADER.size
+        end = start + 8 * (count + 1)
+
+        if end > len(self._map):
+            self.close()
+            raise InvalidIndexError(f'{path} is truncated')
+
+        self._offsets = memoryview(self._map)[start:end].cast('Q')
+        self._start = end
+        self._count = count
+
+    #
+    def __enter__(self):
+        return self
+
+    #
+    def __exit__(self, *exc_info):
+        self.close()
+
+    #
+    def close(self):
+        # the view of the offsets must be released before the map is closed
+        if getattr(self, '_offsets', None) is not None:
+            self._offsets.release()
+            self._offsets = None
+
+        self._map.close()
+        self._file.close()
+
+    #
+    def __len__(self):
+        return self._count
+
+    #
+    def _key(self, index):
+        start = self._start
+        return self._map[start + self._offsets[index]:start + self._offsets[index + 1]]     # noqa: E501
+
+    #
+    def _find(self, key):
+        (data, offsets, start) = (self._map, self._offsets, self._start)
+
+        (lo, hi) = (0, self._count)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if data[start + offsets[mid]:start + offsets[mid + 1]] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        return lo < self._count and self._key(lo) == key
+
+    #
+    def keys(self):
+        for index in range(self._count):
+            yield self._key(index)
+
+    #
+    def __iter__(self):
+        for key in self.keys():
+            yield fqdn_from_key(key.decode('utf-8'))
+
+    #
+    def __contains__(self, fqdn):
+        # exact lookup, without covering subdomains
+        return self._find(sort_key(fqdn.lower().rstrip('.')).encode('utf-8'))
+
+    #
+    def match(self, fqdn):
+        # the blocked domain covering fqdn, itself or its closest listed
+        # parent, as a static local-zone blocks every name below it
+        key = sort_key(fqdn.lower().rstrip('.')).encode('utf-8')
+
+        end = len(key)
+        while end > 0:
+            if self._find(key[:end]):
+                return fqdn_from_key(key[:end].decode('utf-8'))
+            end = key.rfind(_SEPARATOR, 0, end)
+
+        return None
+
+    #
+    def blocked(self, fqdn):
+        return self.match(fqdn) is not None
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Indexes for matching FQDNs against exclude and include adjustments
+"""
+
+import logging
+import collections
+import functools
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:     # pragma: no cover
+    import sre_parse
+
+
+#
+LOG = logging.getLogger(__name__)
+
+WILDCARD_PREFIX = '*.'
+
+# literals shorter than this let too many FQDNs through to be worth checking
+MIN_LITERAL_LENGTH = 3
+
+# patterns using these cannot be safely renumbered inside one alternation
+_GROUP_REFERENCE_RE = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+
+_SCOPED_FLAGS = [
+    (re.I, 'i'),
+    (re.A, 'a'),
+    (re.M, 'm'),
+    (re.S, 's'),
+    (re.X, 'x'),
+]
+
+_TERMINAL = None
+
+
+#
+def labels(fqdn):
+    # the labels of an FQDN, ignoring the root's trailing dot
+    return fqdn.rstrip('.').split('.')
+
+
+#
+class SuffixTrie:
+    __slots__ = ('root', 'size')
+
+    def __init__(self, domains=()):
+        self.root = {}
+        self.size = 0
+
+        for domain in domains:
+            self.add(domain)
+
+    #
+    def __len__(self):
+        return self.size
+
+    #
+    def add(self, domain):
+        node = self.root
+        for label in reversed(labels(domain.lower())):
+            node = node.setdefault(label, {})
+
+        if _TERMINAL not in node:
+            node[_TERMINAL] = True
+            self.size += 1
+
+    #
+    def covers(self, fqdn):
+        # true when fqdn is a strict subdomain of any domain in the trie
+        node = self.root
+        for label in reversed(labels(fqdn)[1:]):
+            node = node.get(label)
+            if node is None:
+                return False
+
+            if _TERMINAL in node:
+                return True
+
+        return False
+
+
+#
+class FQDNMatcher:
+    __slots__ = ('exact', 'wildcards')
+
+    def __init__(self, fqdns=()):
+        self.exact = set()
+        self.wildcards = SuffixTrie()
+
+        for fqdn in fqdns:
+            self.add(fqdn)
+
+    #
+    def add(self, fqdn):
+        if fqdn.startswith(WILDCARD_PREFIX):
+            self.wildcards.add(fqdn[len(WILDCARD_PREFIX):])
+        else:
+            self.exact.add(fqdn)
+
+    #
+    def __contains__(self, fqdn):
+        return fqdn in self.exact or self.wildcards.covers(fqdn)
+
+    #
+    def filter(self, fqdns):
+        # the members of fqdns that match nothing, exact entries are removed
+        # with a single set difference before walking the trie
+        remaining = set(fqdns)
+        remaining -= self.exact
+
+        if len(self.wildcards) == 0:
+            return remaining
+
+        covers = self.wildcards.covers
+        return {fqdn for fqdn in remaining if not covers(fqdn)}
+
+
+#
+def _required_literals(items):
+    # runs of characters that every match of the parsed sequence must contain
+    runs = [[]]
+    for (op, av) in items:
+        if op is sre_parse.LITERAL:
+            runs[-1].append(chr(av))
+        elif op is sre_parse.SUBPATTERN and av[1] == 0 and av[2] == 0:
+            inner = _required_literals(av[-1])
+            runs[-1].extend(inner[0])
+            runs.extend([list(run) for run in inner[1:]])
+        else:
+            runs.append([])
+
+    return [''.join(run) for run in runs]
+
+
+#
+def required_literal(compiled_re):
+    # the longest literal substring every match must contain, or None
+    try:
+        items = sre_parse.parse(compiled_re.pattern, compiled_re.flags)
+    except (re.error, TypeError):
+        return None
+
+    literal = max(_required_literals(items), key=len)
+    if len(literal) < MIN_LITERAL_LENGTH:
+        return None
+
+    # a case insensitive pattern can only be prefiltered on uncased literals
+    if compiled_re.flags & re.I and literal.lower() != literal.upper():
+        return None
+
+    return literal
+
+
+#
+def _scoped(compiled_re):
+    flags = ''.join(letter for (flag, letter) in _SCOPED_FLAGS if compiled_re.flags & flag)   # noqa: E501
+    if flags:
+        return f'(?{flags}:{compiled_re.pattern})'
+
+    return f'(?:{compiled_re.pattern})'
+
+
+#
+class RegexEngine:
+    __slots__ = ('rules', 'combined', 'prefilter', 'standalone')
+
+    def __init__(self, regexes):
+        self.rules = {}
+        self.standalone = []
+
+        branches = []
+        literals = []
+        unfiltered = False
+
+        for (index, (adj, compiled_re)) in enumerate(regexes):
+            name = f'r{index}'
+            branch = f'(?P<{name}>{_scoped(compiled_re)})'
+
+            try:
+                if _GROUP_REFERENCE_RE.search(compiled_re.pattern):
+                    raise re.error('group references')
+                re.compile(branch)
+            except re.error:
+                # evaluated on its own, exactly as written
+                self.standalone.append((adj, compiled_re))
+                continue
+
+            self.rules[name] = adj
+            branches.append(branch)
+
+            literal = required_literal(compiled_re)
+            if literal is None:
+                unfiltered = True
+            else:
+                literals.append(literal)
+
+        self.combined = None
+        self.prefilter = None
+
+        if branches:
+            try:
+                self.combined = re.compile('|'.join(branches))
+            except re.error:
+                # e.g. two patterns using the same group name
+                self.standalone = list(regexes)
+                self.rules = {}
+                return
+
+            if not unfiltered:
+                literals = sorted(set(literals), key=len, reverse=True)
+                self.prefilter = re.compile('|'.join(map(re.escape, literals)))   # noqa: E501
+
+    #
+    def __len__(self):
+        return len(self.rules) + len(self.standalone)
+
+    #
+    def match(self, fqdn):
+        # the adjustment that matches fqdn, or None
+        if self.combined is not None:
+            if self.prefilter is None or self.prefilter.search(fqdn):
+                m = self.combined.fullmatch(fqdn)
+                if m:
+                    return self.rules[m.lastgroup]
+
+        for (adj, compiled_re) in self.standalone:
+            if compiled_re.fullmatch(fqdn):
+                return adj
+
+        return None
+
+    #
+    def filter(self, fqdns):
+        # the members of fqdns that no regex matches
+        if LOG.isEnabledFor(logging.DEBUG):
+            hits = collections.Counter()
+            remaining = set()
+
+            for fqdn in fqdns:
+                adj = self.match(fqdn)
+                if adj is None:
+                    remaining.add(fqdn)
+                else:
+                    hits[adj] += 1
+
+            for (adj, count) in hits.most_common():
+                LOG.debug(f'regex adjustment {adj} matched {count} FQDNs')
+
+            return remaining
+
+        remaining = fqdns
+        if self.combined is not None:
+            fullmatch = self.combined.fullmatch
+
+            if self.prefilter is None:
+                remaining = {fqdn for fqdn in remaining if not fullmatch(fqdn)}    # noqa: E501
+            else:
+                search = self.prefilter.search
+                remaining = {fqdn for fqdn in remaining if not (search(fqdn) and fullmatch(fqdn))}  # noqa: E501
+
+        for (adj, compiled_re) in self.standalone:
+            fullmatch = compiled_re.fullmatch
+            remaining = {fqdn for fqdn in remaining if not fullmatch(fqdn)}
+
+        return set(remaining)
+
+
+#
+@functools.lru_cache(maxsize=32)
+def _compile_regexes(key):
+    return RegexEngine([(adj, re.compile(pattern, flags)) for (adj, pattern, flags) in key])     # noqa: E501
+
+
+#
+def compile_regexes(regexes):
+    # build, or reuse, the engine for a list of (adjustment, compiled_re)
+    key = tuple((adj, compiled_re.pattern, compiled_re.flags) for (adj, compiled_re) in regexes)    # noqa: E501
+    return _compile_regexes(key)
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
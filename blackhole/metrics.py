@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Per-source and per-phase build metrics, exported as JSON or Prometheus text
+"""
+
+import logging
+import collections
+import contextlib
+import heapq
+import itertools
+import json
+import sys
+import tempfile
+import threading
+import time
+
+from blackhole.domainset import DomainSet
+from blackhole.publish import atomic_open
+
+try:
+    import resource
+except ImportError:     # pragma: no cover
+    resource = None
+
+
+#
+LOG = logging.getLogger(__name__)
+
+PREFIX = 'blackhole'
+
+SOURCE_FIELDS = [
+    ('bytes', 'Bytes downloaded for the source'),
+    ('status', 'HTTP status of the last response for the source'),
+    ('cache_hit', 'Whether the source was served from the HTTP cache'),
+    ('parse_cache_hit', 'Whether the parsed source was reused'),
+    ('download_seconds', 'Time spent downloading the source'),
+    ('parse_seconds', 'Time spent parsing the source'),
+    ('lines', 'Lines seen in the source'),
+    ('accepted', 'FQDNs accepted from the source'),
+    ('rejected', 'Lines of the source that held no FQDN'),
+    ('unique', 'FQDNs found in no other source'),
+    ('stale', 'Whether the last good copy stood in for a failed download'),
+]
+
+PHASE_FIELDS = [
+    ('seconds', 'Wall-clock time spent in the phase'),
+    ('peak_rss_bytes', 'Peak resident memory during the phase, or of the process until its end where the peak cannot be reset'),   # noqa: E501
+    ('download_seconds', 'Download time of every source, summed as they overlap'),   # noqa: E501
+    ('parse_seconds', 'Parse time of every source, summed as they overlap'),
+]
+
+
+#
+def reset_peak_rss():
+    # Linux resets the high-water mark read back by peak_rss() on request
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        pass
+
+
+#
+def peak_rss():
+    # the high-water mark since the last reset, if there is one to read
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+
+    if resource is None:
+        return None
+
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # kilobytes everywhere except macOS
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+
+#
+class SourceMetrics:
+    __slots__ = [name for (name, _) in SOURCE_FIELDS]
+
+    def __init__(self):
+        for (name, _) in SOURCE_FIELDS:
+            setattr(self, name, None)
+
+    #
+    def to_dict(self):
+        return {name: getattr(self, name) for (name, _) in SOURCE_FIELDS}
+
+
+#
+class Metrics:
+    def __init__(self, directory=None):
+        self.lock = threading.Lock()
+        self.directory = directory
+
+        self.sources = collections.OrderedDict()
+        self.phases = collections.OrderedDict()
+        self.totals = {}
+
+        # url to a temporary file of the source's sort keys, in order
+        self._contributions = collections.OrderedDict()
+
+    #
+    def source(self, url):
+        with self.lock:
+            if url not in self.sources:
+                self.sources[url] = SourceMetrics()
+            return self.sources[url]
+
+    #
+    @contextlib.contextmanager
+    def phase(self, name):
+        # time spent in a phase adds up over every time it is entered, and
+        # its peak memory is the highest of any of them
+        reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = peak_rss()
+
+            with self.lock:
+                phase = self.phases.setdefault(name, {'seconds': 0.0, 'peak_rss_bytes': None})   # noqa: E501
+                phase['seconds'] += elapsed
+                if peak is not None:
+                    phase['peak_rss_bytes'] = max(peak, phase['peak_rss_bytes'] or 0)   # noqa: E501
+
+    #
+    def record_contribution(self, url, fqdns):
+        # keep the sorted keys of the source on disk, to be merged with the
+        # others once every source is in
+        if not isinstance(fqdns, DomainSet):
+            fqdns = DomainSet(fqdns)
+
+        f = tempfile.TemporaryFile(dir=self.directory)
+        f.writelines(key + b'\n' for key in fqdns.keys())
+        f.seek(0)
+
+        previous = self._contributions.pop(url, None)
+        if previous is not None:
+            previous.close()
+        self._contributions[url] = f
+
+    #
+    def _count_unique(self):
+        # merge the sources' keys and count those that only one of them holds,
+        # without the newlines, as b'\n' sorts after the label separator
+        runs = [zip((line.rstrip(b'\n') for line in f), itertools.repeat(url)) for (url, f) in self._contributions.items()]   # noqa: E501
+        counts = collections.Counter()
+
+        for (_, group) in itertools.groupby(heapq.merge(*runs), key=lambda pair: pair[0]):   # noqa: E501
+            urls = [url for (_, url) in group]
+            if len(urls) == 1:
+                counts[urls[0]] += 1
+
+        return counts
+
+    #
+    def finish(self):
+        # download and parse time of every source, summed as they overlap,
+        # next to the wall-clock time of the fetch phase
+        with self.lock:
+            phase = self.phases.setdefault('fetch', {'seconds': 0.0, 'peak_rss_bytes': None})   # noqa: E501
+
+            for field in ('download_seconds', 'parse_seconds'):
+                seconds = [getattr(source, field) for source in self.sources.values()]   # noqa: E501
+                phase[field] = sum(s for s in seconds if s is not None)
+
+        counts = self._count_unique()
+
+        for (url, f) in self._contributions.items():
+            self.source(url).unique = counts.get(url, 0)
+            f.close()
+
+        self._contributions = collections.OrderedDict()
+
+    #
+    def to_dict(self):
+        return {
+            'timestamp': time.time(),
+            'totals': dict(self.totals),
+            'phases': {name: dict(phase) for (name, phase) in self.phases.items()},   # noqa: E501
+            'sources': {url: source.to_dict() for (url, source) in self.sources.items()},   # noqa: E501
+        }
+
+    #
+    def write_json(self, f):
+        json.dump(self.to_dict(), f, indent=1)
+        f.write('\n')
+
+    #
+    def write_prometheus(self, f):
+        def escape(value):
+            return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')   # noqa: E501
+
+        def number(value):
+            if isinstance(value, bool):
+                return int(value)
+            return value
+
+        for (name, help_text) in SOURCE_FIELDS:
+            f.write(f'# HELP {PREFIX}_source_{name} {help_text}\n')
+            f.write(f'# TYPE {PREFIX}_source_{name} gauge\n')
+            for (url, source) in self.sources.items():
+                value = getattr(source, name)
+                if value is not None:
+                    f.write(f'{PREFIX}_source_{name}{{url="{escape(url)}"}} {number(value)}\n')   # noqa: E501
+
+        for (name, help_text) in PHASE_FIELDS:
+            f.write(f'# HELP {PREFIX}_phase_{name} {help_text}\n')
+            f.write(f'# TYPE {PREFIX}_phase_{name} gauge\n')
+            for (phase_name, phase) in self.phases.items():
+                if phase.get(name) is not None:
+                    f.write(f'{PREFIX}_phase_{name}{{phase="{escape(phase_name)}"}} {phase[name]}\n')   # noqa: E501
+
+        for (name, value) in sorted(self.totals.items()):
+            f.write(f'# TYPE {PREFIX}_{name} gauge\n')
+            f.write(f'{PREFIX}_{name} {number(value)}\n')
+
+        f.write(f'# TYPE {PREFIX}_last_build_timestamp_seconds gauge\n')
+        f.write(f'{PREFIX}_last_build_timestamp_seconds {time.time()}\n')
+
+    #
+    def save(self, path, prometheus=False):
+        # replaced atomically, node_exporter may read the file at any time
+        with atomic_open(path) as f:
+            if prometheus:
+                self.write_prometheus(f)
+            else:
+                self.write_json(f)
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
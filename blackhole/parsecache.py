@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of parsed blocklists keyed by the content they were parsed from
+"""
+
+import logging
+import hashlib
+import json
+import os
+import threading
+
+from blackhole import parser
+from blackhole.publish import atomic_open
+
+
+#
+LOG = logging.getLogger(__name__)
+
+INDEX_NAME = 'index.json'
+SUFFIX = '.fqdns'
+
+
+#
+def hasher():
+    # identical bodies share a digest, and changing the parser invalidates it
+    return hashlib.sha256(parser.LINE_RE.pattern)
+
+
+#
+def digest(content):
+    h = hasher()
+    h.update(content)
+
+    return h.hexdigest()
+
+
+#
+class ParseCache:
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.index = {}
+        try:
+            with open(os.path.join(self.directory, INDEX_NAME), 'r') as f:
+                self.index = json.load(f)
+        except (IOError, ValueError):
+            pass
+
+        # the digest each URL had during this run
+        self.digests = {}
+
+    #
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    #
+    def _write(self, path, data):
+        # data is bytes or an iterable of them
+        if isinstance(data, bytes):
+            data = [data]
+
+        with atomic_open(path, 'wb') as f:
+            f.writelines(data)
+
+    #
+    def load(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except IOError:
+            return None
+
+        if len(data) == 0:
+            return []
+
+        return data.decode('ascii').split('\n')
+
+    #
+    def store(self, key, fqdns):
+        # written as they come, without joining them into one string first
+        def lines():
+            separator = b''
+            for fqdn in fqdns:
+                yield separator + fqdn.encode('ascii')
+                separator = b'\n'
+
+        self._write(self._path(key), lines())
+
+    #
+    def record(self, url, key, fqdns):
+        # store FQDNs parsed elsewhere, e.g. from a stream, as those of url
+        self.store(key, fqdns)
+
+        with self.lock:
+            self.digests[url] = key
+
+    #
+    def parse(self, url, content, executor=None, stats=None):
+        key = digest(content)
+
+        with self.lock:
+            self.digests[url] = key
+
+        fqdns = self.load(key)
+        if fqdns is not None:
+            LOG.debug(f'Using parsed copy of {url}')
+            if stats is not None:
+                stats['cached'] = True
+            return fqdns
+
+        fqdns = parser.parse(content, executor=executor, stats=stats, source=url)    # noqa: E501
+        self.store(key, fqdns)
+
+        return fqdns
+
+    #
+    def last_good(self, url):
+        # the FQDNs parsed from url on the most recent run that retrieved it
+        key = self.index.get(url)
+        if key is None:
+            return None
+
+        fqdns = self.load(key)
+        if fqdns is not None:
+            with self.lock:
+                self.digests.setdefault(url, key)
+
+        return fqdns
+
+    #
+    def open_last_good(self, url):
+        # the same FQDNs as last_good(), as a file of one per line to read
+        # them from one at a time, or None
+        key = self.index.get(url)
+        if key is None:
+            return None
+
+        try:
+            f = open(self._path(key), 'rb')
+        except IOError:
+            return None
+
+        with self.lock:
+            self.digests.setdefault(url, key)
+
+        return f
+
+    #
+    def save(self):
+        # remember this run's digests and drop parsed lists nothing refers to
+        with self.lock:
+            self.index.update(self.digests)
+            index = dict(self.index)
+
+        self._write(os.path.join(self.directory, INDEX_NAME), json.dumps(index, indent=1).encode('utf-8'))   # noqa: E501
+
+        keep = set(index.values())
+        for name in os.listdir(self.directory):
+            if name.endswith(SUFFIX) and name[:-len(SUFFIX)] not in keep:
+                os.unlink(os.path.join(self.directory, name))
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
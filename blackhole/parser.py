@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk blocklist parser working directly on the raw response bytes
+"""
+
+import logging
+import collections
+import concurrent.futures
+import multiprocessing
+import re
+import sys
+
+
+#
+LOG = logging.getLogger(__name__)
+
+# a process pool takes a start method from Python 3.7 on
+SPAWN_POOLS = sys.version_info >= (3, 7)
+
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+# bodies smaller than this are not worth shipping to worker processes
+DEFAULT_PARALLEL_THRESHOLD = 16 * 1024 * 1024
+
+FQDN_PATTERN = rb'(?:[a-z0-9_-]+\.)+[a-z][a-z0-9_-]*[a-z]\.?'
+IPV4_PATTERN = rb'[0-9]{1,3}(?:\.[0-9]{1,3}){3}'
+IPV6_PATTERN = rb'[0-9a-f:]+'
+IP_PATTERN = rb'(?:' + IPV4_PATTERN + rb'|' + IPV6_PATTERN + rb')'
+
+# one accepted line:  an optional IP, the FQDN, and an optional comment, all
+# matched in a single pass over a lower cased, \n terminated block of lines
+LINE_RE = re.compile(rb'^[ \t\f\v]*(?:' + IP_PATTERN + rb'[ \t\f\v]+)?(' + FQDN_PATTERN + rb')[ \t\f\v]*(?:#[^\n]*)?$', re.M)   # noqa: E501
+
+# whatever is left of a line that is not blank and not just a comment
+REJECT_RE = re.compile(rb'^[ \t\f\v]*([^#\s][^#\n]*)', re.M)
+
+# rejected lines are counted by the first category they match
+REJECT_CATEGORIES = [
+    ('ip-only', re.compile(rb'(?:' + IPV4_PATTERN + rb'|[0-9a-f]*:[0-9a-f:]*)$')),  # noqa: E501
+    ('adblock', re.compile(rb'(?:\|\||@@|!|\[)|.*[$^]')),
+    ('url', re.compile(rb'[a-z][a-z0-9+.-]*://|.*/')),
+    ('no-dot', re.compile(rb'(?:' + IP_PATTERN + rb'[ \t\f\v]+)?[a-z0-9_-]+$')),   # noqa: E501
+    ('invalid-chars', re.compile(rb'.*[^a-z0-9_. \t\f\v-]')),
+]
+
+# examples of rejected lines kept for each category
+DEFAULT_SAMPLE_SIZE = 3
+
+
+#
+def normalize(data):
+    # fold case and line endings once for the whole block rather than per line
+    data = data.lower()
+
+    if b'\r' in data:
+        data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+    return data
+
+
+#
+def iter_chunks(data, chunk_size=DEFAULT_CHUNK_SIZE):
+    # split data into blocks of about chunk_size bytes ending on a line break
+    start = 0
+    length = len(data)
+
+    while start < length:
+        end = start + chunk_size
+        if end >= length:
+            yield data[start:]
+            return
+
+        newline = data.find(b'\n', end)
+        if newline == -1:
+            yield data[start:]
+            return
+
+        yield data[start:newline + 1]
+        start = newline + 1
+
+
+#
+def parse_chunk(chunk):
+    chunk = normalize(chunk)
+
+    # splitting on the capturing LINE_RE alternates between the text between
+    # accepted lines and the accepted FQDNs themselves
+    parts = LINE_RE.split(chunk)
+
+    fqdns = list(map(bytes.decode, parts[1::2]))
+
+    gaps = b''.join(parts[0::2])
+    if not gaps or gaps.isspace():
+        return (fqdns, [])
+
+    rejected = [line.rstrip() for line in REJECT_RE.findall(gaps)]
+
+    return (fqdns, rejected)
+
+
+#
+def _parse_packed(chunk):
+    # runs in a worker process, one bytes object pickles far faster than a
+    # list of str
+    chunk = normalize(chunk)
+
+    parts = LINE_RE.split(chunk)
+
+    packed = b'\n'.join(parts[1::2])
+
+    gaps = b''.join(parts[0::2])
+    if not gaps or gaps.isspace():
+        return (packed, [])
+
+    return (packed, [line.rstrip() for line in REJECT_RE.findall(gaps)])
+
+
+#
+def create_executor(workers):
+    # processes are spawned rather than forked as downloads run in threads,
+    # and without a way to ask for that lists are parsed in this process
+    if not SPAWN_POOLS:
+        LOG.debug('Parsing in one process, pools cannot be spawned before Python 3.7')   # noqa: E501
+        return None
+
+    context = multiprocessing.get_context('spawn')
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context)     # noqa: E501
+
+
+#
+def classify(line):
+    for (category, pattern) in REJECT_CATEGORIES:
+        if pattern.match(line):
+            return category
+    return 'other'
+
+
+#
+class Rejections:
+    # rejected lines of one list, counted per category with a few examples
+    def __init__(self, sample_size=DEFAULT_SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self.counts = collections.Counter()
+        self.samples = collections.defaultdict(list)
+
+    #
+    def __len__(self):
+        return sum(self.counts.values())
+
+    #
+    def add(self, rejected):
+        for line in rejected:
+            category = classify(line)
+            self.counts[category] += 1
+
+            samples = self.samples[category]
+            if len(samples) < self.sample_size:
+                samples.append(line.decode('utf-8', 'replace'))
+
+    #
+    def summary(self):
+        return ', '.join(f'{category} {count} (e.g. {", ".join(map(repr, self.samples[category]))})'    # noqa: E501
+                         for (category, count) in self.counts.most_common())
+
+    #
+    def log(self, source=None):
+        # a single warning per list however many lines it rejected
+        if not self.counts or not LOG.isEnabledFor(logging.WARNING):
+            return
+
+        LOG.warning('%s:  no FQDN pattern matched %d lines:  %s',
+                    source or 'blocklist', len(self), self.summary())
+
+
+#
+def parse(data, chunk_size=DEFAULT_CHUNK_SIZE, executor=None,
+          parallel_threshold=DEFAULT_PARALLEL_THRESHOLD, stats=None,
+          source=None):
+    fqdns = []
+    rejections = Rejections()
+
+    # large bodies are parsed a chunk per worker process
+    if executor is not None and len(data) >= parallel_threshold:
+        chunks = iter_chunks(data, chunk_size)
+
+        for (packed, rejected) in executor.map(_parse_packed, chunks):
+            if packed:
+                fqdns.extend(packed.decode('ascii').split('\n'))
+            rejections.add(rejected)
+
+    else:
+        for chunk in iter_chunks(data, chunk_size):
+            (chunk_fqdns, rejected) = parse_chunk(chunk)
+
+            fqdns.extend(chunk_fqdns)
+            rejections.add(rejected)
+
+    rejections.log(source)
+
+    if stats is not None:
+        stats['lines'] = data.count(b'\n') + (1 if data and not data.endswith(b'\n') else 0)  # noqa: E501
+        stats['rejected'] = len(rejections)
+        stats['rejections'] = dict(rejections.counts)
+
+    return fqdns
+
+
+#
+def parse_stream(chunks, chunk_size=DEFAULT_CHUNK_SIZE, stats=None,
+                 source=None):
+    # FQDNs parsed from an iterable of byte chunks, such as a streamed
+    # response, holding no more than about chunk_size bytes at a time
+    rejections = Rejections()
+    lines = 0
+
+    pending = []
+    size = 0
+
+    def flush(block):
+        nonlocal lines
+
+        (fqdns, rejected) = parse_chunk(block)
+        rejections.add(rejected)
+        lines += block.count(b'\n')
+
+        return fqdns
+
+    for data in chunks:
+        pending.append(data)
+        size += len(data)
+        if size < chunk_size:
+            continue
+
+        # cut after the last line break, the rest starts the next block
+        block = b''.join(pending)
+        cut = max(block.rfind(b'\n'), block.rfind(b'\r')) + 1
+        if cut == 0:
+            pending = [block]
+            continue
+
+        pending = [block[cut:]]
+        size = len(pending[0])
+
+        yield from flush(block[:cut])
+
+    tail = b''.join(pending)
+    if tail:
+        yield from flush(tail)
+        if not tail.endswith(b'\n'):
+            lines += 1
+
+    rejections.log(source)
+
+    if stats is not None:
+        stats['lines'] = lines
+        stats['rejected'] = len(rejections)
+        stats['rejections'] = dict(rejections.counts)
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
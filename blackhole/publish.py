@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Atomic publication of output files read by running resolvers
+"""
+
+import logging
+import contextlib
+import os
+import stat
+import tempfile
+
+
+#
+LOG = logging.getLogger(__name__)
+
+DEFAULT_MODE = 0o644
+
+
+#
+@contextlib.contextmanager
+def atomic_open(path, mode='w', encoding='utf-8'):
+    # write to a temporary file beside path and rename it over path once it
+    # is complete and on disk, so that readers see the old file or the new
+    directory = os.path.dirname(os.path.abspath(path))
+
+    try:
+        permissions = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        permissions = DEFAULT_MODE
+
+    (fd, tmp_path) = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        if 'b' in mode:
+            f = os.fdopen(fd, mode)
+        else:
+            f = os.fdopen(fd, mode, encoding=encoding)
+
+        with f:
+            yield f
+
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.chmod(tmp_path, permissions)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+#
+@contextlib.contextmanager
+def publishing(path=None, output=None):
+    # an atomically replaced file when path is given, output otherwise
+    if path is None:
+        yield output
+        return
+
+    with atomic_open(path) as f:
+        yield f
+
+    LOG.debug(f'Published {path}')
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
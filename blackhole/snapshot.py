@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot bundles of a build's inputs, to build again offline and repeatably
+
+A bundle is a zip archive, each member deflated on its own so that any one
+source is read without the rest:
+
+    manifest.json           version, creation time, master list URL, and the
+                            member, SHA-256 and size of the master list and
+                            of every source
+    master.csv              the master list as downloaded
+    sources/<sha256>.txt    the FQDNs parsed from a source, one per line,
+                            stored once however many sources share them
+"""
+
+import logging
+import contextlib
+import hashlib
+import json
+import time
+import zipfile
+
+from blackhole.publish import atomic_open
+
+
+#
+LOG = logging.getLogger(__name__)
+
+VERSION = 1
+
+MANIFEST_NAME = 'manifest.json'
+MASTER_NAME = 'master.csv'
+
+
+#
+class InvalidSnapshotError(ValueError):
+    pass
+
+
+#
+def _entry(member, data):
+    return {'member': member, 'sha256': hashlib.sha256(data).hexdigest(), 'size': len(data)}   # noqa: E501
+
+
+#
+class SnapshotWriter:
+    # replaced atomically once closed, or left alone if the build fails
+    def __init__(self, path, url, master):
+        self.path = path
+        self.created = int(time.time())
+
+        self.manifest = {
+            'version': VERSION,
+            'created': self.created,
+            'url': url,
+            'master': None,
+            'sources': {},
+        }
+
+        self._members = set()
+
+        self._stack = contextlib.ExitStack()
+        try:
+            f = self._stack.enter_context(atomic_open(path, 'wb'))
+            self._zip = self._stack.enter_context(zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED))   # noqa: E501
+        except BaseException:
+            self._stack.close()
+            raise
+
+        self.manifest['master'] = self._add(MASTER_NAME, master)
+
+    #
+    def __enter__(self):
+        return self
+
+    #
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.abort()
+
+    #
+    def _add(self, member, data):
+        if member not in self._members:
+            info = zipfile.ZipInfo(member, date_time=time.gmtime(self.created)[:6])   # noqa: E501
+            info.compress_type = zipfile.ZIP_DEFLATED
+            self._zip.writestr(info, data)
+            self._members.add(member)
+
+        return _entry(member, data)
+
+    #
+    def add_source(self, url, fqdns):
+        data = '\n'.join(fqdns).encode('utf-8')
+        member = f'sources/{hashlib.sha256(data).hexdigest()}.txt'
+
+        self.manifest['sources'][url] = self._add(member, data)
+
+    #
+    def abort(self):
+        # leave any earlier snapshot at path as it was
+        error = InvalidSnapshotError(f'{self.path} was abandoned')
+        self._stack.__exit__(type(error), error, None)
+
+    #
+    def close(self):
+        with self._stack:
+            self._add(MANIFEST_NAME, json.dumps(self.manifest, indent=1, sort_keys=True).encode('utf-8'))   # noqa: E501
+
+        LOG.debug(f'Wrote a snapshot of {len(self.manifest["sources"])} sources to {self.path}')   # noqa: E501
+
+
+#
+class Snapshot:
+    def __init__(self, path):
+        self.path = path
+
+        try:
+            self._zip = zipfile.ZipFile(path)
+        except zipfile.BadZipFile:
+            raise InvalidSnapshotError(f'{path} is not a blackhole snapshot')   # noqa: E501
+
+        try:
+            manifest = json.loads(self._zip.read(MANIFEST_NAME).decode('utf-8'))   # noqa: E501
+        except (KeyError, ValueError):
+            self.close()
+            raise InvalidSnapshotError(f'{path} is not a blackhole snapshot')   # noqa: E501
+
+        if manifest.get('version') != VERSION:
+            self.close()
+            raise InvalidSnapshotError(f'{path} is a version {manifest.get("version")} snapshot, not {VERSION}')   # noqa: E501
+
+        self.manifest = manifest
+        self.url = manifest['url']
+        self.created = manifest['created']
+
+    #
+    def __enter__(self):
+        return self
+
+    #
+    def __exit__(self, *exc_info):
+        self.close()
+
+    #
+    def close(self):
+        self._zip.close()
+
+    #
+    def _read(self, entry):
+        # every member is checked against the manifest before it is used
+        try:
+            data = self._zip.read(entry['member'])
+        except (KeyError, zipfile.BadZipFile) as msg:
+            raise InvalidSnapshotError(f'{self.path}:  {msg}')
+
+        if hashlib.sha256(data).hexdigest() != entry['sha256']:
+            raise InvalidSnapshotError(f'{self.path}:  {entry["member"]} does not match its hash')   # noqa: E501
+
+        return data
+
+    #
+    def master(self):
+        return self._read(self.manifest['master'])
+
+    #
+    def urls(self):
+        return list(self.manifest['sources'])
+
+    #
+    def digest(self, url):
+        # identical for sources that parsed to the same FQDNs
+        entry = self.manifest['sources'].get(url)
+        return None if entry is None else entry['sha256']
+
+    #
+    def source(self, url):
+        # the FQDNs of url, or None if it was not retrieved for the snapshot
+        entry = self.manifest['sources'].get(url)
+        if entry is None:
+            return None
+
+        data = self._read(entry)
+        return data.decode('utf-8').split('\n') if data else []
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Output formats, each writing the sorted FQDNs to a file in large blocks
+"""
+
+import logging
+import gzip
+import io
+import itertools
+
+from blackhole import bind
+from blackhole.extsort import fqdn_from_key
+
+
+#
+LOG = logging.getLogger(__name__)
+
+# FQDNs formatted into each write
+BLOCK_SIZE = 16384
+
+# much faster than the default of 9 for a few percent in size
+DEFAULT_COMPRESSLEVEL = 6
+
+WRITERS = {}
+
+
+#
+def register(name):
+    # make a Writer subclass available as an output format
+    def decorator(cls):
+        cls.name = name
+        WRITERS[name] = cls
+        return cls
+
+    return decorator
+
+
+#
+def formats():
+    return sorted(WRITERS)
+
+
+#
+class Writer:
+    # every FQDN is one LINE, between the header and the footer
+    name = None
+    LINE = '{}\n'
+
+    # whether a listed FQDN blocks its subdomains too, which --collapse needs
+    covers_subdomains = False
+
+    def __init__(self, output, **options):
+        # options a format has no use for are ignored
+        self.output = output
+
+    #
+    def header(self):
+        return ''
+
+    #
+    def footer(self):
+        return ''
+
+    #
+    def format(self, fqdns):
+        # one join is several times faster than formatting each line
+        (prefix, suffix) = self.LINE.split('{}')
+        return prefix + (suffix + prefix).join(fqdns) + suffix
+
+    #
+    def write(self, keys):
+        # keys are sort keys in sorted order, the count of FQDNs is returned
+        output = self.output
+        fqdns = map(fqdn_from_key, keys)
+        count = 0
+
+        output.write(self.header())
+
+        while True:
+            block = list(itertools.islice(fqdns, BLOCK_SIZE))
+            if not block:
+                break
+
+            output.write(self.format(block))
+            count += len(block)
+
+        output.write(self.footer())
+
+        return count
+
+
+#
+@register('text')
+class TextWriter(Writer):
+    LINE = '{}\n'
+
+
+#
+@register('unbound')
+class UnboundWriter(Writer):
+    covers_subdomains = True
+    LINE = 'local-zone: "{}" static\n'
+
+
+#
+@register('hosts')
+class HostsWriter(Writer):
+    # hosts files cannot cover subdomains, only the FQDNs listed are blocked
+    covers_subdomains = False
+    LINE = '0.0.0.0 {}\n'
+
+
+#
+@register('dnsmasq')
+class DnsmasqWriter(Writer):
+    # the FQDN and everything below it answer 0.0.0.0 and ::
+    covers_subdomains = True
+    LINE = 'address=/{}/#\n'
+
+
+#
+@register('bind')
+class BindWriter(Writer):
+    covers_subdomains = True
+
+    def __init__(self, output, serial=None, origin=bind.DEFAULT_ORIGIN,
+                 ttl=bind.DEFAULT_TTL, subdomains=True, **options):
+        super().__init__(output)
+
+        self.serial = serial
+        self.origin = origin
+        self.ttl = ttl
+        self.subdomains = subdomains
+
+    #
+    def header(self):
+        return bind.zone_header(self.serial, self.origin, self.ttl)
+
+    #
+    def format(self, fqdns):
+        return ''.join(f'{name} CNAME .\n' for fqdn in fqdns for name in bind.owner_names(fqdn, self.subdomains))    # noqa: E501
+
+
+#
+def covers_subdomains(format):
+    # a collapsed list only blocks the same FQDNs in these formats
+    return WRITERS[format].covers_subdomains
+
+
+#
+def write_output(output, keys, format='text', compress=False, **options):
+    # write sorted keys as FQDNs to a text file in one of the formats,
+    # gzip compressed onto the file's binary buffer if asked
+    try:
+        writer = WRITERS[format]
+    except KeyError:
+        raise ValueError(f'Unknown output format:  {format}')
+
+    if not compress:
+        return writer(output, **options).write(keys)
+
+    output.flush()
+
+    # no timestamp, so that the same list compresses to the same file
+    with gzip.GzipFile(fileobj=output.buffer, mode='wb', compresslevel=DEFAULT_COMPRESSLEVEL, mtime=0) as raw:  # noqa: E501
+        with io.TextIOWrapper(raw, encoding='utf-8') as text:
+            count = writer(text, **options).write(keys)
+
+    output.buffer.flush()
+
+    return count
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/conftest.py
+"""
+
+import pytest
+
+from benchmarks.server import Server
+
+
+#
+@pytest.fixture
+def http_server():
+    server = Server()
+    server.start()
+
+    yield server
+
+    server.stop()
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
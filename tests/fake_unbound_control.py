@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/fake_unbound_control.py
+
+Stands in for unbound-control, appending each command and its stdin lines
+as JSON to the file named by FAKE_UNBOUND_CONTROL_LOG.
+"""
+
+import json
+import os
+import sys
+
+
+def main():
+    subcommand = sys.argv[-1]
+    lines = sys.stdin.read().splitlines()
+
+    if subcommand not in ('local_zones', 'local_zones_remove'):
+        print(f'error unknown command {subcommand}')
+        sys.exit(1)
+
+    with open(os.environ['FAKE_UNBOUND_CONTROL_LOG'], 'a') as f:
+        f.write(json.dumps([subcommand, lines]) + '\n')
+
+    print('ok')
+
+
+if __name__ == '__main__':
+    main()
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
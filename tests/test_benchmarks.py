@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/test_benchmarks.py
+"""
+
+from benchmarks import corpus, run
+
+from blackhole import parser
+
+
+def test_corpus():
+    body = corpus.blocklist(1000, style='mixed', seed=1)
+
+    assert body.count(b'\n') == 1003
+    assert 500 < len(parser.parse(body)) < 1000
+    assert len(parser.parse(corpus.blocklist(1000, style='hosts'))) == 1000
+
+
+def test_run_and_compare():
+    results = run.run([200], repeat=1)
+
+    assert set(results) == set(f'{name}[200]' for name in ('get_masterlist', 'get_blocklist', 'parse', 'merge', 'make_adjustments', 'output'))   # noqa: E501
+
+    slower = {name: {'seconds': result['seconds'] / 10} for (name, result) in results.items()}   # noqa: E501
+    assert run.compare(results, results) == []
+    assert run.compare(results, slower) == sorted(results)
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/test_bind.py
+"""
+
+import io
+
+from blackhole import bind
+from blackhole.domainset import DomainSet
+from blackhole.writers import write_output
+
+
+def test_rpz_zone():
+    output = io.StringIO()
+
+    keys = DomainSet(['ads.example.com', 'abs.example.net']).sorted_keys()
+    assert write_output(output, keys, 'bind', serial=42, origin='rpz.test.') == 2   # noqa: E501
+
+    lines = output.getvalue().splitlines()
+
+    assert lines[0] == '$TTL 300'
+    assert lines[1] == '$ORIGIN rpz.test.'
+    assert lines[2].startswith('@ IN SOA ') and ' 42 ' in lines[2]
+    assert lines[4:] == [
+        'ads.example.com CNAME .',
+        '*.ads.example.com CNAME .',
+        'abs.example.net CNAME .',
+        '*.abs.example.net CNAME .',
+    ]
+
+
+def test_next_serial(tmp_path):
+    zone = str(tmp_path / 'db.rpz.test')
+
+    assert bind.zone_serial(zone) is None
+
+    # a serial ahead of the clock is still moved past
+    with open(zone, 'w') as f:
+        f.write(bind.zone_header(2**31, origin='rpz.test.'))
+        f.write('ads.example.com CNAME .\n')
+
+    assert bind.zone_serial(zone) == 2**31
+    assert bind.next_serial(bind.zone_serial(zone)) == 2**31 + 1
+    assert bind.next_serial() > 2**30
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
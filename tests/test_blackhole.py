@@ -5,8 +5,11 @@ blackhole/tests/tests.py
 
 import pytest
 import re
+import threading
+import time
+import types
 
-from itertools import chain, combinations
+from itertools import chain, combinations, count
 
 import blackhole
 
@@ -81,6 +84,67 @@ def test_get_blocklist(master_list):
             assert fqdn == m.group('fqdn')
 
 
+def test_get_blocklists(monkeypatch):
+    lock = threading.Lock()
+    active = {}
+    peaks = {}
+
+    def fake_get_blocklist(url, **kwargs):
+        host = url.split('/')[2]
+        with lock:
+            active[host] = active.get(host, 0) + 1
+            peaks[host] = max(peaks.get(host, 0), active[host])
+        time.sleep(0.01)
+        with lock:
+            active[host] -= 1
+        return [url.split('/')[-1]]
+
+    monkeypatch.setattr(blackhole, 'get_blocklist', fake_get_blocklist)
+
+    urls = [f'http://host{i % 3}/list{i}.example.com' for i in range(12)]
+    results = list(blackhole.get_blocklists(urls, jobs=6, per_host=2))
+
+    assert [url for (url, _) in results] == urls
+    assert [blocklist for (_, blocklist) in results] == [[url.split('/')[-1]] for url in urls]    # noqa: E501
+    assert max(peaks.values()) <= 2
+
+
+def test_http_cache(http_server, tmp_path):
+    http_server.files['/list.txt'] = b'0.0.0.0 ads.example.com\ntracker.example.net\n'    # noqa: E501
+    url = http_server.url + '/list.txt'
+
+    fetcher = blackhole.Fetcher(cache=blackhole.HTTPCache(str(tmp_path)))
+
+    first = blackhole.get_blocklist(url, fetcher=fetcher)
+    second = blackhole.get_blocklist(url, fetcher=fetcher)
+
+    assert first == ['ads.example.com', 'tracker.example.net']
+    assert second == first
+
+    (_, headers) = http_server.requests[-1]
+    assert 'If-None-Match' in headers
+
+
+def test_fetcher(http_server):
+    http_server.files['/csv.txt'] = b'"tracking","tick","site","desc","http://lists/a.txt"\n'      # noqa: E501
+    http_server.files['/a.txt'] = b'a.example.com\n'
+
+    with blackhole.Fetcher(timeout=5, retries=0) as fetcher:
+        master_list = blackhole.get_masterlist(http_server.url + '/csv.txt', fetcher=fetcher)   # noqa: E501
+        blocklist = blackhole.get_blocklist(http_server.url + '/a.txt', fetcher=fetcher)        # noqa: E501
+
+        # an error page is a failed download rather than a list
+        with pytest.raises(blackhole.FileRetrieveError):
+            blackhole.get_blocklist(http_server.url + '/missing.txt', fetcher=fetcher)   # noqa: E501
+
+    assert len(master_list) == 1
+    assert master_list[0]['category'] == blackhole.Category.TRACKING
+    assert blocklist == ['a.example.com']
+
+    for (_, headers) in http_server.requests:
+        assert headers['Accept-Encoding'] == 'gzip, deflate'
+
+
 def test_adjustments():
     fqdns = set(['abc.com', 'def.ab.com', 'def.com', 'dee.net', 'Deg.org'])
     includes = ['ghi.com', 'xyz.com']
@@ -93,4 +157,223 @@ def test_adjustments():
 
     assert len(nfqdns) == 4
 
+
+def test_wildcard_adjustments():
+    fqdns = set(['example.com', 'ads.example.com', 'a.ads.example.com', 'example.net'])   # noqa: E501
+    includes = blackhole.create_adjustments([], allow_regexes=False)
+    excludes = blackhole.create_adjustments(['*.example.com', 'example.net'])
+
+    nfqdns = blackhole.make_adjustments(fqdns, includes, excludes)
+
+    assert nfqdns == set(['example.com'])
+
+
+def test_collapse():
+    fqdns = ['ads.example.com', 'a.ads.example.com', 'b.a.ads.example.com',
+             'adsx.example.com', 'example.net', 'www.example.net', 'other.org']   # noqa: E501
+    keys = blackhole.DomainSet(fqdns).sorted_keys()
+
+    stats = {}
+    collapsed = [blackhole.fqdn_from_key(key) for key in blackhole.collapse(keys, stats)]  # noqa: E501
+
+    assert collapsed == ['ads.example.com', 'adsx.example.com', 'example.net', 'other.org']  # noqa: E501
+    assert stats == {'kept': 4, 'removed': 3}
+
+
+def test_parse_cache(http_server, tmp_path, monkeypatch):
+    http_server.files['/a.txt'] = b'a.example.com\n0.0.0.0 b.example.com\n'
+    http_server.files['/mirror.txt'] = http_server.files['/a.txt']
+
+    parse_cache = blackhole.ParseCache(str(tmp_path))
+    urls = [http_server.url + '/a.txt', http_server.url + '/mirror.txt']
+
+    first = dict(blackhole.get_blocklists(urls, parse_cache=parse_cache))
+    parse_cache.save()
+
+    # a second run must not parse either list again
+    def no_parse(content):
+        raise AssertionError('parsed again')
+    monkeypatch.setattr(blackhole.parser, 'parse', no_parse)
+
+    parse_cache = blackhole.ParseCache(str(tmp_path))
+    second = dict(blackhole.get_blocklists(urls, parse_cache=parse_cache))
+
+    assert first == second
+    assert second[urls[0]] == ['a.example.com', 'b.example.com']
+    assert parse_cache.digests[urls[0]] == parse_cache.digests[urls[1]]
+    assert len(list(tmp_path.glob('*.fqdns'))) == 1
+
+
+def test_get_blocklists_deadline(monkeypatch):
+    def fake_get_blocklist(url, **kwargs):
+        if 'dead' in url:
+            raise blackhole.FileRetrieveError('connection refused')
+        if 'slow' in url:
+            time.sleep(2)
+        return [url.split('/')[-1]]
+
+    monkeypatch.setattr(blackhole, 'get_blocklist', fake_get_blocklist)
+
+    errors = {}
+
+    def fallback(url, msg):
+        errors[url] = msg
+        return None if 'dead' in url else ['last.good.example.com']
+
+    urls = ['http://a/a.example.com', 'http://b/slow', 'http://c/dead', 'http://d/d.example.com']   # noqa: E501
+
+    start = time.monotonic()
+    results = list(blackhole.get_blocklists(urls, jobs=4, deadline=start + 0.3, fallback=fallback))   # noqa: E501
+
+    assert time.monotonic() - start < 1.5
+    assert results == [
+        (urls[0], ['a.example.com']),
+        (urls[1], ['last.good.example.com']),
+        (urls[2], None),
+        (urls[3], ['d.example.com']),
+    ]
+    assert isinstance(errors[urls[1]], blackhole.DeadlineExceeded)
+    assert not isinstance(errors[urls[2]], blackhole.DeadlineExceeded)
+
+    # without a fallback the first failure raises
+    with pytest.raises(blackhole.FileRetrieveError):
+        list(blackhole.get_blocklists(urls, jobs=4, deadline=time.monotonic() + 0.3))  # noqa: E501
+
+
+def test_last_good(http_server, tmp_path):
+    http_server.files['/a.txt'] = b'a.example.com\n'
+    url = http_server.url + '/a.txt'
+
+    parse_cache = blackhole.ParseCache(str(tmp_path))
+    assert parse_cache.last_good(url) is None
+
+    blackhole.get_blocklist(url, parse_cache=parse_cache)
+    parse_cache.save()
+
+    del http_server.files['/a.txt']
+
+    parse_cache = blackhole.ParseCache(str(tmp_path))
+    with pytest.raises(blackhole.FileRetrieveError):
+        blackhole.get_blocklist(url, parse_cache=parse_cache)
+
+    assert parse_cache.last_good(url) == ['a.example.com']
+    assert url in parse_cache.digests
+
+
+def test_fetcher_deadline(http_server, monkeypatch):
+    http_server.files['/a.txt'] = b'a.example.com\n'
+    url = http_server.url + '/a.txt'
+
+    with blackhole.Fetcher(max_time=5) as fetcher:
+        assert blackhole.get_blocklist(url, fetcher=fetcher) == ['a.example.com']   # noqa: E501
+
+    with blackhole.Fetcher(deadline=time.monotonic()) as fetcher:
+        with pytest.raises(blackhole.FileRetrieveError):
+            blackhole.get_blocklist(url, fetcher=fetcher)
+
+    # nor is a request made once the deadline passes before it is sent
+    clock = count(0, 0.4)
+    monkeypatch.setattr(blackhole.fetcher, 'time', types.SimpleNamespace(monotonic=lambda: next(clock), perf_counter=time.perf_counter))   # noqa: E501
+
+    with blackhole.Fetcher(deadline=0.5) as fetcher:
+        with pytest.raises(blackhole.FileRetrieveError):
+            blackhole.get_blocklist(url, fetcher=fetcher)
+
+    assert len(http_server.requests) == 1
+
+
+def test_file_adjustments(tmp_path):
+    nested = tmp_path / 'nested.txt'
+    nested.write_text('nested.example.com\n')
+
+    allowlist = tmp_path / 'allow.txt'
+    allowlist.write_text(f'# shared allowlist\n\na.example.com\n  b.example.com  \n/^ads[0-9]+\\./\n@{nested}\n')    # noqa: E501
+
+    (fqdns, regexes) = blackhole.create_adjustments([f'@{allowlist}'])
+
+    assert fqdns == {'a.example.com', 'b.example.com', 'nested.example.com'}
+    assert [adj for (adj, _) in regexes] == ['/^ads[0-9]+\\./']
+
+    # nested files follow allow_regexes too
+    (fqdns, regexes) = blackhole.create_adjustments([f'@{allowlist}'], allow_regexes=False)   # noqa: E501
+    assert fqdns == {'a.example.com', 'b.example.com', 'nested.example.com'}
+    assert regexes == []
+
+
+def test_adjustment_cache(tmp_path):
+    nested = tmp_path / 'nested.txt'
+    nested.write_text('nested.example.com\n')
+
+    allowlist = tmp_path / 'allow.txt'
+    allowlist.write_text(f'a.example.com\n/^ads/\n@{nested}\n')
+
+    cache = blackhole.AdjustmentCache(str(tmp_path / 'cache'))
+    first = blackhole.create_adjustments([f'@{allowlist}'], cache=cache)
+
+    (fqdns, patterns, files) = cache.load(str(allowlist), True)
+    assert sorted(fqdns) == ['a.example.com', 'nested.example.com']
+    assert patterns == ['/^ads/']
+    assert set(files) == {str(allowlist), str(nested)}
+
+    second = blackhole.create_adjustments([f'@{allowlist}'], cache=cache)
+    assert second[0] == first[0]
+    assert [adj for (adj, _) in second[1]] == ['/^ads/']
+
+    # a change to a nested file invalidates the file that includes it
+    nested.write_text('nested.example.com\nmore.example.com\n')
+    assert cache.load(str(allowlist), True) is None
+
+    (fqdns, _) = blackhole.create_adjustments([f'@{allowlist}'], cache=cache)
+    assert 'more.example.com' in fqdns
+
+
+def test_stream_blocklist(http_server, tmp_path, monkeypatch):
+    body = b''.join(b'0.0.0.0 host%d.example.com\n' % i for i in range(20000))
+    http_server.files['/big.txt'] = body
+    url = http_server.url + '/big.txt'
+
+    cache = blackhole.HTTPCache(str(tmp_path / 'http'))
+    parse_cache = blackhole.ParseCache(str(tmp_path / 'parsed'))
+    metrics = blackhole.Metrics()
+
+    with blackhole.Fetcher(cache=cache, metrics=metrics) as fetcher:
+        fqdns = list(blackhole.stream_blocklist(url, fetcher=fetcher))
+        assert fqdns == blackhole.parser.parse(body)
+
+        # the streamed body was written through to the cache
+        assert cache.load(url) == body
+        assert metrics.source(url).status == 200
+
+        domains = blackhole.get_domainset(url, fetcher=fetcher, parse_cache=parse_cache, metrics=metrics)   # noqa: E501
+        assert metrics.source(url).cache_hit
+        assert metrics.source(url).accepted == 20000
+
+    assert sorted(domains) == sorted(fqdns)
+    assert parse_cache.digests[url] == blackhole.parsecache.digest(body)
+
+    parse_cache.save()
+    assert sorted(parse_cache.last_good(url)) == sorted(fqdns)
+
+    # on the next run, an unchanged body is not parsed again
+    def parse_stream(chunks, **kwargs):
+        for chunk in chunks:
+            raise AssertionError('parsed again')
+        yield from ()
+
+    parse_cache = blackhole.ParseCache(str(tmp_path / 'parsed'))
+    with monkeypatch.context() as patch, blackhole.Fetcher(cache=cache, metrics=metrics) as fetcher:   # noqa: E501
+        patch.setattr(blackhole.parser, 'parse_stream', parse_stream)
+        domains = blackhole.get_domainset(url, fetcher=fetcher, parse_cache=parse_cache, metrics=metrics)   # noqa: E501
+
+    assert sorted(domains) == sorted(fqdns)
+    assert metrics.source(url).parse_cache_hit
+    assert parse_cache.digests[url] == blackhole.parsecache.digest(body)
+
+    results = dict(blackhole.get_blocklists([url], stream=True))
+    assert isinstance(results[url], blackhole.DomainSet)
+    assert len(results[url]) == 20000
+
+    with pytest.raises(blackhole.FileRetrieveError):
+        list(blackhole.stream_blocklist(http_server.url + '/missing.txt'))
+
 # vim:sw=4:ts=4:et:fenc=utf-8:
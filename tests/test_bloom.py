@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/test_bloom.py
+"""
+
+import pytest
+
+from blackhole.bloom import BloomFilter, InvalidFilterError, parameters, write_bloom   # noqa: E501
+
+
+def test_parameters():
+    (bits, hashes) = parameters(1000000, 0.001)
+
+    # about 1.8MB and 10 probes per FQDN
+    assert 14000000 < bits < 14500000
+    assert bits % 64 == 0
+    assert hashes == 10
+
+    with pytest.raises(ValueError):
+        parameters(10, 1.5)
+
+
+def test_bloom(tmpdir):
+    fqdns = [f'host{i}.example.com' for i in range(5000)]
+    path = str(tmpdir.join('blocked.bloom'))
+
+    written = write_bloom(path, fqdns + ['ads.example.net.'], len(fqdns) + 1, 0.01)   # noqa: E501
+    bloom = BloomFilter.load(path)
+
+    assert (bloom.bits, bloom.hashes, bloom.count) == (written.bits, written.hashes, 5001)   # noqa: E501
+    assert all(fqdn in bloom for fqdn in fqdns)
+    assert 'ADS.example.net' in bloom
+
+    assert bloom.match('a.b.ads.example.net') == 'ads.example.net'
+    assert bloom.blocked('www.host17.example.com')
+
+    misses = sum(f'other{i}.example.org' in bloom for i in range(10000))
+    assert misses < 200
+    assert bloom.false_positive_rate() == pytest.approx(0.01, rel=0.2)
+
+
+def test_invalid(tmpdir):
+    path = tmpdir.join('bogus.bloom')
+
+    path.write('not a filter')
+    with pytest.raises(InvalidFilterError):
+        BloomFilter.load(str(path))
+
+    write_bloom(str(path), ['ads.example.com'], 1)
+    path.write_binary(path.read_binary()[:-1])
+    with pytest.raises(InvalidFilterError):
+        BloomFilter.load(str(path))
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/test_daemon.py
+"""
+
+import os
+import random
+
+import blackhole
+from blackhole.daemon import Refresher
+from blackhole.publish import atomic_open
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_refresher(http_server, tmpdir):
+    base = http_server.url
+    http_server.files['/csv.txt'] = (
+        f'"tracking","tick","s","A list","{base}/a.txt"\n'
+        f'"advertising","tick","s","B list","{base}/b.txt"\n'
+    ).encode('utf-8')
+    http_server.files['/a.txt'] = b'ads.example.com\nshared.example.com\n'
+    http_server.files['/b.txt'] = b'0.0.0.0 shared.example.com\n'
+
+    builds = []
+    clock = Clock()
+    cache = blackhole.HTTPCache(str(tmpdir.join('http')))
+
+    with blackhole.Fetcher(cache=cache) as fetcher:
+        refresher = Refresher(f'{base}/csv.txt', blackhole.ALL_CATEGORIES,
+                              blackhole.Quality.TICK,
+                              lambda domains: builds.append(list(domains)),
+                              fetcher, interval=100, jitter=0.1, clock=clock,
+                              rng=random.Random(3))
+
+        # everything is fetched and built on the first poll
+        assert refresher.poll()
+        assert builds == [['ads.example.com', 'shared.example.com']]
+        assert 90 <= refresher.next_due() - clock.now <= 110
+
+        # nothing is due yet
+        requests = len(http_server.requests)
+        assert not refresher.poll()
+        assert len(http_server.requests) == requests
+
+        # unchanged lists are not rebuilt and are checked less often
+        clock.now += 120
+        assert not refresher.poll()
+        assert len(builds) == 1
+        assert all(180 <= source.due - clock.now <= 220 for source in refresher.sources.values())  # noqa: E501
+
+        # a changed list is rebuilt, a failing one keeps its last good copy
+        http_server.files['/b.txt'] = b'new.example.org\n'
+        del http_server.files['/a.txt']
+        clock.now += 250
+        assert refresher.poll()
+        assert builds[-1] == ['ads.example.com', 'shared.example.com', 'new.example.org']   # noqa: E501
+
+        source = refresher.sources[f'{base}/a.txt']
+        assert source.failures == 1
+        assert source.due - clock.now <= 66
+
+        # a list dropped from the master list is dropped from the build
+        http_server.files['/csv.txt'] = f'"advertising","tick","s","B list","{base}/b.txt"\n'.encode('utf-8')   # noqa: E501
+        refresher.refresh_all()
+        assert refresher.poll()
+        assert builds[-1] == ['new.example.org']
+
+
+def test_atomic_open(tmpdir):
+    path = str(tmpdir.join('zone.conf'))
+
+    with atomic_open(path) as f:
+        f.write('old\n')
+    os.chmod(path, 0o600)
+
+    try:
+        with atomic_open(path) as f:
+            f.write('half written')
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+
+    assert open(path).read() == 'old\n'
+    assert os.listdir(str(tmpdir)) == ['zone.conf']
+
+    with atomic_open(path) as f:
+        f.write('new\n')
+
+    assert open(path).read() == 'new\n'
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/test_delta.py
+"""
+
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import blackhole
+from blackhole import delta
+
+
+FAKE_UNBOUND_CONTROL = os.path.join(os.path.dirname(__file__), 'fake_unbound_control.py')   # noqa: E501
+
+
+def test_delta(tmp_path):
+    state = str(tmp_path / 'state')
+
+    old = blackhole.DomainSet(['a.example.com', 'b.example.com', 'c.example.org'])   # noqa: E501
+    new = blackhole.DomainSet(['b.example.com', 'c.example.org', 'd.example.net'])   # noqa: E501
+
+    delta.write_state(state, old.sorted_keys())
+
+    # readable by others, like every file blackhole replaces
+    assert os.stat(state).st_mode & 0o777 == 0o644
+
+    (add_file, remove_file) = (io.StringIO(), io.StringIO())
+    counts = delta.write_delta(delta.read_state(state), new.sorted_keys(), add_file, remove_file)   # noqa: E501
+
+    assert counts == (1, 1)
+    assert add_file.getvalue() == 'd.example.net\n'
+    assert remove_file.getvalue() == 'a.example.com\n'
+
+    # no previous state means everything is new
+    changes = list(delta.diff(delta.read_state(str(tmp_path / 'none')), new.sorted_keys()))   # noqa: E501
+    assert [change for (change, _) in changes] == ['+'] * 3
+
+
+def test_unbound_control(tmp_path, monkeypatch):
+    log = tmp_path / 'log'
+    monkeypatch.setenv('FAKE_UNBOUND_CONTROL_LOG', str(log))
+
+    control = delta.UnboundControl([sys.executable, FAKE_UNBOUND_CONTROL], batch_size=2)   # noqa: E501
+
+    assert control.add(['a.com', 'b.com', 'c.com']) == 3
+    assert control.remove(['d.com']) == 1
+
+    calls = [json.loads(line) for line in log.read_text().splitlines()]
+    assert calls == [
+        ['local_zones', ['a.com static', 'b.com static']],
+        ['local_zones', ['c.com static']],
+        ['local_zones_remove', ['d.com']],
+    ]
+
+    with pytest.raises(blackhole.UnboundControlError):
+        control._run('reload', ['x\n'])
+
+
+def test_failed_list_keeps_state(http_server, tmp_path):
+    http_server.files['/a.txt'] = b'b.example.com\nc.example.com\n'
+
+    master = tmp_path / 'master.csv'
+    master.write_text(f'"tracking","tick","s","A","{http_server.url}/a.txt"\n'
+                      f'"tracking","tick","s","Gone","{http_server.url}/gone.txt"\n')   # noqa: E501
+
+    state = tmp_path / 'state'
+    log = tmp_path / 'log'
+    control = f'{sys.executable} {FAKE_UNBOUND_CONTROL}'
+
+    def run():
+        root = os.path.dirname(os.path.dirname(blackhole.__file__))
+        return subprocess.run([sys.executable, '-m', 'blackhole.cli', '-s', '-u', str(master),   # noqa: E501
+                               '-o', str(tmp_path / 'out'), '--state', str(state),   # noqa: E501
+                               '--apply', '--unbound-control', control],
+                              cwd=root, env=dict(os.environ, FAKE_UNBOUND_CONTROL_LOG=str(log))).returncode   # noqa: E501
+
+    def calls():
+        calls = [json.loads(line) for line in log.read_text().splitlines()]
+        log.unlink()
+        return calls
+
+    # a first run still records what it found, but fails so it is noticed
+    assert run() != 0
+    assert state.read_text() == 'b.example.com\nc.example.com\n'
+    assert calls() == [['local_zones', ['b.example.com static', 'c.example.com static']]]   # noqa: E501
+
+    # the FQDNs a left out list may hold are neither removed nor forgotten
+    state.write_text('a.example.com\nb.example.com\n')
+    http_server.files['/a.txt'] += b'd.example.com\n'
+
+    assert run() != 0
+    assert state.read_text() == 'a.example.com\nb.example.com\nc.example.com\nd.example.com\n'   # noqa: E501
+    assert calls() == [['local_zones', ['c.example.com static', 'd.example.com static']]]   # noqa: E501
+
+    # until every list is back
+    http_server.files['/gone.txt'] = b'c.example.com\n'
+
+    assert run() == 0
+    assert state.read_text() == 'b.example.com\nc.example.com\nd.example.com\n'   # noqa: E501
+    assert calls() == [['local_zones_remove', ['a.example.com']]]
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/test_domainset.py
+"""
+
+import random
+
+import blackhole
+from blackhole.domainset import DomainSet
+
+
+def random_fqdns(count, seed=9):
+    rng = random.Random(seed)
+    return [f'h{rng.randrange(count)}.d{rng.randrange(50)}.com' for _ in range(count)]    # noqa: E501
+
+
+def test_domainset():
+    fqdns = random_fqdns(3000)
+    expected = sorted(set(fqdns), key=lambda fqdn: fqdn.split('.')[::-1])
+
+    # a small buffer pushes everything through several segment merges
+    domains = DomainSet(buffer_size=100)
+    domains.update(fqdns[:1500])
+    for fqdn in fqdns[1500:]:
+        domains.add(fqdn)
+
+    assert list(domains) == expected
+    assert all(fqdn in domains for fqdn in fqdns)
+    assert 'missing.example.com' not in domains
+    assert len(domains) == len(expected)
+    assert len(domains._segments) == 1
+
+
+def test_domainset_spill(tmp_path):
+    fqdns = random_fqdns(2000)
+    expected = sorted(set(fqdns), key=lambda fqdn: fqdn.split('.')[::-1])
+
+    # both the keys and their offsets go to disk, nothing is left on the heap
+    domains = DomainSet(fqdns, max_memory=20000, directory=str(tmp_path))
+    domains.compact()
+
+    assert domains.buffer_size < 2000
+    assert domains._segments[0].file is not None
+    assert domains.nbytes() == 0
+    assert list(domains) == expected
+    assert expected[100] in domains
+
+    domains.close()
+
+    # a spill of nothing is simply empty
+    empty = DomainSet.from_sorted_keys([], max_memory=0, directory=str(tmp_path))   # noqa: E501
+    assert list(empty) == []
+    empty.close()
+
+
+def test_domainset_adjustments():
+    fqdns = DomainSet(['abc.com', 'def.ab.com', 'def.com', 'dee.net', 'a.skip.org'])  # noqa: E501
+    includes = blackhole.create_adjustments(['ghi.com'], allow_regexes=False)
+    excludes = blackhole.create_adjustments(['def.com', '*.skip.org', r'/de.\.net/'])   # noqa: E501
+
+    nfqdns = blackhole.make_adjustments(fqdns, includes, excludes)
+
+    assert isinstance(nfqdns, DomainSet)
+    assert list(nfqdns) == ['def.ab.com', 'abc.com', 'ghi.com']
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/test_extsort.py
+"""
+
+from blackhole import extsort
+
+
+FQDNS = ['a.example.com', 'example.com', 'ab.com', 'a.z.com', 'b.example.com',
+         'example.net', 'x.example.io.', 'a-b.example.com', 'a_b.example.com']  # noqa: E501
+
+
+def test_sort_key():
+    for fqdn in FQDNS:
+        assert extsort.fqdn_from_key(extsort.sort_key(fqdn)) == fqdn
+
+    expected = sorted(FQDNS, key=lambda fqdn: fqdn.split('.')[::-1])
+
+    assert sorted(FQDNS, key=extsort.sort_key) == expected
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
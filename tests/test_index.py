@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/test_index.py
+"""
+
+import pytest
+
+import blackhole
+from blackhole.index import Index, InvalidIndexError, write_index
+
+
+FQDNS = ['ads.example.com', 'example.net', 'tracker.example.org.',
+         'b.tracker.example.org', 'x.y.z.example.io']
+
+
+def build(tmpdir, fqdns=FQDNS):
+    path = str(tmpdir.join('blocked.idx'))
+    keys = blackhole.DomainSet(fqdns).sorted_keys()
+
+    return (path, write_index(path, keys))
+
+
+def test_index(tmpdir):
+    (path, count) = build(tmpdir)
+
+    with Index(path) as index:
+        assert count == len(index) == 5
+        assert list(index) == sorted({fqdn.rstrip('.') for fqdn in FQDNS}, key=lambda fqdn: fqdn.split('.')[::-1])    # noqa: E501
+
+        assert 'ads.example.com' in index
+        assert 'ADS.example.com.' in index
+        assert 'tracker.example.org' in index
+        assert 'example.com' not in index
+        assert 'www.ads.example.com' not in index
+
+
+def test_match(tmpdir):
+    (path, _) = build(tmpdir)
+
+    with Index(path) as index:
+        assert index.match('ads.example.com') == 'ads.example.com'
+        assert index.match('a.b.ads.example.com') == 'ads.example.com'
+        assert index.match('cdn.b.tracker.example.org') == 'b.tracker.example.org'   # noqa: E501
+        assert index.match('www.example.net') == 'example.net'
+        assert index.match('y.z.example.io') is None
+        assert index.match('badsexample.com') is None
+        assert index.blocked('www.example.net')
+        assert not index.blocked('example.com')
+
+
+def test_empty_and_invalid(tmpdir):
+    (path, count) = build(tmpdir, fqdns=[])
+
+    with Index(path) as index:
+        assert count == len(index) == 0
+        assert not index.blocked('example.com')
+
+    bogus = tmpdir.join('bogus.idx')
+    bogus.write('not an index at all')
+    with pytest.raises(InvalidIndexError):
+        Index(str(bogus))
+
+    bogus.write('')
+    with pytest.raises(InvalidIndexError):
+        Index(str(bogus))
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/test_matcher.py
+"""
+
+import re
+
+from blackhole import matcher
+
+
+def test_suffix_trie():
+    trie = matcher.SuffixTrie(['example.com', 'ads.example.net.'])
+
+    assert trie.covers('a.example.com')
+    assert trie.covers('b.a.example.com')
+    assert trie.covers('x.ads.example.net')
+    assert not trie.covers('example.com')
+    assert not trie.covers('badexample.com')
+    assert not trie.covers('example.net')
+
+
+def test_required_literal():
+    assert matcher.required_literal(re.compile(r'ads?\.doubleclick\.net')) == '.doubleclick.net'    # noqa: E501
+    assert matcher.required_literal(re.compile(r'x(?:yz)w\d+')) == 'xyzw'
+    assert matcher.required_literal(re.compile(r'ab|cd')) is None
+    assert matcher.required_literal(re.compile(r'tracker\.', re.I)) is None
+    assert matcher.required_literal(re.compile(r'.*\.123\.', re.I)) == '.123.'
+
+
+def test_regex_engine():
+    regexes = [
+        ('/ads?\\.doubleclick\\.net/', re.compile(r'ads?\.doubleclick\.net')),
+        ('/de.\\.(com|net)/i', re.compile(r'de.\.(com|net)', re.I)),
+        ('/(a)b\\1/', re.compile(r'(a)b\1')),
+    ]
+    fqdns = set(['ad.doubleclick.net', 'ads.doubleclick.net', 'DEF.com',
+                 'aba', 'abb', 'example.com'])
+
+    engine = matcher.RegexEngine(regexes)
+
+    assert len(engine) == 3
+    assert len(engine.standalone) == 1
+    assert engine.match('ads.doubleclick.net') == regexes[0][0]
+    assert engine.match('DEF.com') == regexes[1][0]
+    assert engine.match('aba') == regexes[2][0]
+    assert engine.match('example.com') is None
+
+    assert engine.filter(fqdns) == set(['abb', 'example.com'])
+
+
+def test_compile_regexes_cached():
+    regexes = [('/foo\\.com/', re.compile(r'foo\.com'))]
+
+    assert matcher.compile_regexes(regexes) is matcher.compile_regexes(list(regexes))  # noqa: E501
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
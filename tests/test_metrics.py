@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/test_metrics.py
+"""
+
+import io
+import json
+import os
+
+import pytest
+
+import blackhole
+from blackhole.metrics import Metrics
+
+
+def test_phase():
+    metrics = Metrics()
+
+    with metrics.phase('sort'):
+        pass
+    with metrics.phase('sort'):
+        pass
+
+    assert list(metrics.phases) == ['sort']
+    assert metrics.phases['sort']['seconds'] >= 0
+    assert metrics.phases['sort']['peak_rss_bytes'] > 0
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/self/clear_refs'), reason='needs Linux')   # noqa: E501
+def test_phase_peak():
+    metrics = Metrics()
+
+    with metrics.phase('large'):
+        data = b'x' * (64 * 2**20)
+    del data
+
+    with metrics.phase('small'):
+        pass
+
+    # each phase has a peak of its own, not the process's so far
+    assert metrics.phases['small']['peak_rss_bytes'] < metrics.phases['large']['peak_rss_bytes'] - 32 * 2**20   # noqa: E501
+
+
+def test_unique_contributions():
+    metrics = Metrics()
+
+    metrics.record_contribution('http://a/', ['a.com', 'b.com', 'c.com'])
+    metrics.record_contribution('http://b/', ['b.com', 'd.com'])
+    metrics.record_contribution('http://c/', blackhole.DomainSet(['b.com', 'c.com']))   # noqa: E501
+    metrics.finish()
+
+    assert metrics.source('http://a/').unique == 1
+    assert metrics.source('http://b/').unique == 1
+    assert metrics.source('http://c/').unique == 0
+
+    # a subdomain sorts between its parent and the parent's next sibling
+    metrics = Metrics()
+
+    metrics.record_contribution('http://a/', ['ads.example.com', 'a.ads.example.com'])   # noqa: E501
+    metrics.record_contribution('http://b/', ['ads.example.com'])
+    metrics.finish()
+
+    assert metrics.source('http://a/').unique == 1
+    assert metrics.source('http://b/').unique == 0
+
+
+def test_fetch_phase():
+    metrics = Metrics()
+
+    # sources fetched side by side add up to more than the wall-clock time
+    with metrics.phase('fetch'):
+        for url in ('http://a/', 'http://b/'):
+            metrics.source(url).download_seconds = 5.0
+            metrics.source(url).parse_seconds = 1.0
+    metrics.finish()
+
+    phase = metrics.phases['fetch']
+    assert phase['seconds'] < 5.0
+    assert phase['peak_rss_bytes'] > 0
+    assert (phase['download_seconds'], phase['parse_seconds']) == (10.0, 2.0)
+
+
+def test_export():
+    metrics = Metrics()
+
+    source = metrics.source('http://example.com/"list"')
+    source.status = 200
+    source.cache_hit = False
+    source.accepted = 3
+    metrics.totals['fqdns'] = 3
+    metrics.finish()
+
+    f = io.StringIO()
+    metrics.write_prometheus(f)
+    text = f.getvalue()
+
+    assert 'blackhole_source_status{url="http://example.com/\\"list\\""} 200\n' in text   # noqa: E501
+    assert 'blackhole_source_cache_hit{url="http://example.com/\\"list\\""} 0\n' in text  # noqa: E501
+    assert 'blackhole_fqdns 3\n' in text
+    assert '# TYPE blackhole_phase_seconds gauge\n' in text
+
+    f = io.StringIO()
+    metrics.write_json(f)
+    data = json.loads(f.getvalue())
+
+    assert data['sources']['http://example.com/"list"']['accepted'] == 3
+    assert data['totals'] == {'fqdns': 3}
+
+
+def test_source_metrics(http_server, tmpdir):
+    http_server.files['/list.txt'] = b'ads.example.com\njunk\n0.0.0.0 t.example.net\n'   # noqa: E501
+    url = f'{http_server.url}/list.txt'
+
+    metrics = Metrics()
+    cache = blackhole.HTTPCache(str(tmpdir.join('http')))
+    parse_cache = blackhole.ParseCache(str(tmpdir.join('parsed')))
+
+    with blackhole.Fetcher(cache=cache, metrics=metrics) as fetcher:
+        blackhole.get_blocklist(url, fetcher=fetcher, parse_cache=parse_cache, metrics=metrics)   # noqa: E501
+
+        source = metrics.source(url)
+        assert (source.status, source.cache_hit, source.bytes) == (200, False, 43)   # noqa: E501
+        assert (source.lines, source.accepted, source.rejected) == (3, 2, 1)
+        assert source.parse_cache_hit is False
+
+        blackhole.get_blocklist(url, fetcher=fetcher, parse_cache=parse_cache, metrics=metrics)   # noqa: E501
+
+        assert (source.status, source.cache_hit, source.bytes) == (304, True, 0)   # noqa: E501
+        assert source.parse_cache_hit is True
+        assert source.accepted == 2
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
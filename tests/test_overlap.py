@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/test_overlap.py
+"""
+
+import heapq
+
+import pytest
+
+import blackhole
+from blackhole.cli import print_overlap
+from blackhole.overlap import Overlap, Sketch, prune_masterlist, _hashes
+
+
+def fqdns(start, stop):
+    return [f'host{i}.example.com' for i in range(start, stop)]
+
+
+def sources():
+    return {
+        'a': fqdns(0, 3000),
+        'b': fqdns(0, 3000),            # a mirror of a
+        'c': fqdns(2000, 4000),         # half new
+        'd': fqdns(0, 100),             # nothing new
+    }
+
+
+def test_exact():
+    overlap = Overlap('exact')
+    for (url, names) in sources().items():
+        overlap.add(url, names)
+
+    assert overlap.union_size() == 4000
+    assert overlap.unique() == {'a': 0, 'b': 0, 'c': 1000, 'd': 0}
+
+    pairs = overlap.pairs()
+    assert pairs[0] == ('a', 'b', 3000, 1.0)
+    assert ('a', 'c', 1000, 0.25) in pairs
+
+    assert overlap.recommend(1.0) == [('a', 0.75), ('c', 1.0)]
+    assert overlap.recommend(0.5) == [('a', 0.75)]
+
+    report = overlap.report()
+    assert report['sources']['c'] == {'size': 2000, 'unique': 1000}
+    assert [entry['url'] for entry in report['recommended']] == ['a', 'c']
+
+    with pytest.raises(ValueError):
+        overlap.recommend(0)
+
+
+def test_print_overlap(capsys):
+    overlap = Overlap('exact')
+    for (url, names) in sources().items():
+        overlap.add(url, names)
+
+    # the coverage reached is printed, next to the one asked for
+    print_overlap(overlap.report(0.5))
+    assert '1 of 4 lists cover 75.0% of the FQDNs, for a target of 50.0%:' in capsys.readouterr().out   # noqa: E501
+
+
+def test_minhash():
+    overlap = Overlap('minhash', sketch_size=512)
+    for (url, names) in sources().items():
+        overlap.add(url, names)
+
+    assert overlap.union_size() == pytest.approx(4000, rel=0.15)
+    assert overlap.unique()['c'] == pytest.approx(1000, rel=0.3)
+    assert overlap.unique()['a'] == 0
+    (a, b, shared, jaccard) = overlap.pairs()[0]
+    assert (a, b, jaccard) == ('a', 'b', 1.0)
+    assert shared == pytest.approx(3000, rel=0.15)
+    assert [url for (url, _) in overlap.recommend(1.0)] == ['a', 'c']
+
+
+def test_sketch():
+    # small sets are held whole, and estimated exactly
+    small = Sketch.from_fqdns(fqdns(0, 100))
+    other = Sketch.from_fqdns(fqdns(50, 150))
+
+    assert small.union(other).cardinality() == 150
+    assert small.jaccard(other) == pytest.approx(50 / 150)
+
+    # a large set only ever keeps its smallest hashes, each once
+    names = fqdns(0, 20000)
+    sketch = Sketch.from_fqdns(names + names, size=64)
+
+    assert len(sketch.hashes) == 64
+    assert sketch.hashes == sorted(heapq.nsmallest(64, set(_hashes(names))))
+    assert sketch.cardinality() == pytest.approx(20000, rel=0.4)
+
+
+def test_prune_masterlist(tmp_path):
+    master = (b'"tracking","tick","s","A list","http://lists.test/a.txt"\n'
+              b'"advertising","tick","s","B, a list","http://lists.test/b.txt"\n')   # noqa: E501
+
+    pruned = prune_masterlist(master, ['http://lists.test/b.txt'])
+    assert pruned == master.splitlines(keepends=True)[1]
+
+    # and it can be built from
+    path = tmp_path / 'pruned.csv'
+    path.write_bytes(pruned)
+
+    rows = blackhole.get_masterlist(str(path))
+    assert [row['url'] for row in rows] == ['http://lists.test/b.txt']
+
+    with pytest.raises(blackhole.FileRetrieveError):
+        blackhole.get_masterlist(str(tmp_path / 'missing.csv'))
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
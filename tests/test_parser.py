@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/test_parser.py
+"""
+
+import logging
+
+import pytest
+
+from blackhole import parser
+
+
+BODY = b'''# a comment
+ads.example.com
+0.0.0.0 Tracker.Example.NET
+127.0.0.1\tfoo.example.org   # trailing comment
+::1 bar.example.io.
+
+||adblock.example.com^
+   spaced.example.com#comment\r
+1.2.3.4
+localhost
+'''
+
+
+def test_parse():
+    fqdns = parser.parse(BODY)
+
+    assert fqdns == [
+        'ads.example.com',
+        'tracker.example.net',
+        'foo.example.org',
+        'bar.example.io.',
+        'spaced.example.com',
+    ]
+
+
+def test_parse_chunk_rejects():
+    (_, rejected) = parser.parse_chunk(BODY)
+
+    assert rejected == [b'||adblock.example.com^', b'1.2.3.4', b'localhost']
+
+
+def test_iter_chunks():
+    data = b''.join(b'host%d.example.com\n' % i for i in range(1000))
+
+    chunks = list(parser.iter_chunks(data, chunk_size=100))
+
+    assert len(chunks) > 1
+    assert b''.join(chunks) == data
+    assert all(chunk.endswith(b'\n') for chunk in chunks)
+    assert parser.parse(data, chunk_size=100) == parser.parse(data)
+
+
+@pytest.mark.skipif(not parser.SPAWN_POOLS, reason='needs Python 3.7')
+def test_parse_parallel():
+    data = b''.join(b'0.0.0.0 host%d.example.com\njunk %d\n' % (i, i) for i in range(5000))   # noqa: E501
+
+    with parser.create_executor(2) as executor:
+        fqdns = parser.parse(data, chunk_size=1000, executor=executor, parallel_threshold=0)  # noqa: E501
+
+    assert fqdns == parser.parse(data)
+    assert len(fqdns) == 5000
+
+
+def test_parse_without_pools(monkeypatch):
+    monkeypatch.setattr(parser, 'SPAWN_POOLS', False)
+
+    assert parser.create_executor(2) is None
+
+
+def test_classify():
+    assert parser.classify(b'1.2.3.4') == 'ip-only'
+    assert parser.classify(b'::1') == 'ip-only'
+    assert parser.classify(b'||adblock.example.com^') == 'adblock'
+    assert parser.classify(b'http://example.com/ads') == 'url'
+    assert parser.classify(b'localhost') == 'no-dot'
+    assert parser.classify(b'0.0.0.0 localhost') == 'no-dot'
+    assert parser.classify(b'ads.exa%mple.com') == 'invalid-chars'
+    assert parser.classify(b'two words.example.com') == 'other'
+
+
+def test_parse_rejections(caplog):
+    data = BODY + b''.join(b'||ad%d.example.com^\n' % i for i in range(100))
+    stats = {}
+
+    with caplog.at_level(logging.WARNING, logger='blackhole.parser'):
+        parser.parse(data, stats=stats, source='http://example.com/list')
+
+    assert stats['rejected'] == 103
+    assert stats['rejections'] == {'adblock': 101, 'ip-only': 1, 'no-dot': 1}   # noqa: E501
+
+    # one summary for the whole list with a bounded number of examples
+    assert len(caplog.records) == 1
+    message = caplog.records[0].getMessage()
+    assert message.startswith('http://example.com/list:  no FQDN pattern matched 103 lines:  adblock 101')  # noqa: E501
+    assert message.count('example.com^') == parser.DEFAULT_SAMPLE_SIZE
+
+
+def test_parse_stream():
+    data = BODY * 50 + b'last.example.com'
+
+    # chunks that split lines, and CRLF pairs, at every possible point
+    for size in (1, 7, 64, 1000):
+        chunks = [data[i:i + size] for i in range(0, len(data), size)]
+        (stats, expected) = ({}, {})
+
+        fqdns = list(parser.parse_stream(chunks, chunk_size=32, stats=stats))   # noqa: E501
+
+        assert fqdns == parser.parse(data, stats=expected)
+        assert stats == expected
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/test_snapshot.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+import zipfile
+
+import pytest
+
+import blackhole
+from blackhole.snapshot import Snapshot, SnapshotWriter, InvalidSnapshotError
+
+
+MASTER = b'"tracking","tick","s","A list","http://lists.test/a.txt"\n'
+
+
+def test_snapshot(tmp_path):
+    path = str(tmp_path / 'snapshot.zip')
+
+    with SnapshotWriter(path, 'http://lists.test/csv.txt', MASTER) as bundle:
+        bundle.add_source('http://lists.test/a.txt', ['ads.example.com', 'b.example.com'])   # noqa: E501
+        bundle.add_source('http://mirror.test/a.txt', ['ads.example.com', 'b.example.com'])  # noqa: E501
+        bundle.add_source('http://lists.test/empty.txt', [])
+
+    with Snapshot(path) as snapshot:
+        assert snapshot.url == 'http://lists.test/csv.txt'
+        assert snapshot.master() == MASTER
+        assert len(snapshot.urls()) == 3
+
+        assert snapshot.source('http://lists.test/a.txt') == ['ads.example.com', 'b.example.com']   # noqa: E501
+        assert snapshot.source('http://lists.test/empty.txt') == []
+        assert snapshot.source('http://lists.test/missing.txt') is None
+
+        # mirrors share one member
+        assert snapshot.digest('http://lists.test/a.txt') == snapshot.digest('http://mirror.test/a.txt')   # noqa: E501
+
+    with zipfile.ZipFile(path) as f:
+        assert len(f.namelist()) == 4
+
+
+def test_abort(tmp_path):
+    path = str(tmp_path / 'snapshot.zip')
+
+    with SnapshotWriter(path, 'http://lists.test/csv.txt', MASTER):
+        pass
+
+    # a failed build leaves the earlier snapshot in place
+    with pytest.raises(RuntimeError):
+        with SnapshotWriter(path, 'http://lists.test/other.txt', MASTER):
+            raise RuntimeError('build failed')
+
+    assert Snapshot(path).url == 'http://lists.test/csv.txt'
+    assert os.listdir(str(tmp_path)) == ['snapshot.zip']
+
+
+def test_invalid(tmp_path):
+    path = str(tmp_path / 'snapshot.zip')
+
+    with open(path, 'wb') as f:
+        f.write(b'not a zip')
+    with pytest.raises(InvalidSnapshotError):
+        Snapshot(path)
+
+    # members that do not match the manifest are refused
+    manifest = {'version': 1, 'created': 0, 'url': 'u', 'sources': {},
+                'master': {'member': 'master.csv', 'sha256': '0' * 64, 'size': 1}}   # noqa: E501
+    with zipfile.ZipFile(path, 'w') as f:
+        f.writestr('manifest.json', json.dumps(manifest))
+        f.writestr('master.csv', MASTER)
+
+    with Snapshot(path) as snapshot, pytest.raises(InvalidSnapshotError):
+        snapshot.master()
+
+    manifest['version'] = 2
+    with zipfile.ZipFile(path, 'w') as f:
+        f.writestr('manifest.json', json.dumps(manifest))
+
+    with pytest.raises(InvalidSnapshotError):
+        Snapshot(path)
+
+
+def test_offline(tmp_path):
+    snapshot = str(tmp_path / 'snapshot.zip')
+    output = str(tmp_path / 'blackhole.txt')
+
+    with SnapshotWriter(snapshot, 'http://lists.test/csv.txt', MASTER) as bundle:   # noqa: E501
+        bundle.add_source('http://lists.test/a.txt', ['b.example.com', 'ads.example.com'])   # noqa: E501
+
+    # the build must not so much as import requests
+    script = ('import sys\n'
+              'sys.modules["requests"] = sys.modules["urllib3"] = None\n'
+              'from blackhole.cli import main\n'
+              'main()\n')
+
+    root = os.path.dirname(os.path.dirname(blackhole.__file__))
+    subprocess.run([sys.executable, '-c', script, '-s', '--offline', snapshot, '-o', output],   # noqa: E501
+                   cwd=root, check=True)
+
+    with open(output) as f:
+        assert f.read() == 'ads.example.com\nb.example.com\n'
+
+# vim:sw=4:ts=4:et:fenc=utf-8:
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+blackhole/tests/test_writers.py
+"""
+
+import gzip
+import io
+
+import pytest
+
+from blackhole import writers
+from blackhole.domainset import DomainSet
+from blackhole.publish import atomic_open
+
+
+FQDNS = ['ads.example.com', 'tracker.example.net', 'b.example.com']
+
+
+def write(format, **options):
+    output = io.StringIO()
+    count = writers.write_output(output, DomainSet(FQDNS).sorted_keys(), format, **options)   # noqa: E501
+
+    assert count == len(FQDNS)
+    return output.getvalue().splitlines()
+
+
+def test_formats():
+    assert writers.formats() == ['bind', 'dnsmasq', 'hosts', 'text', 'unbound']   # noqa: E501
+
+    assert write('text') == ['ads.example.com', 'b.example.com', 'tracker.example.net']   # noqa: E501
+    assert write('unbound')[0] == 'local-zone: "ads.example.com" static'
+    assert write('hosts')[1] == '0.0.0.0 b.example.com'
+    assert write('dnsmasq')[2] == 'address=/tracker.example.net/#'
+
+    lines = write('bind', serial=42, origin='rpz.test.')
+    assert lines[1] == '$ORIGIN rpz.test.'
+    assert ' 42 ' in lines[2]
+    assert lines[4:6] == ['ads.example.com CNAME .', '*.ads.example.com CNAME .']   # noqa: E501
+
+    with pytest.raises(ValueError):
+        write('hosts.deny')
+
+
+def test_covers_subdomains():
+    # only these formats can take a collapsed list
+    assert [f for f in writers.formats() if writers.covers_subdomains(f)] == ['bind', 'dnsmasq', 'unbound']   # noqa: E501
+
+
+def test_blocks(monkeypatch):
+    # lines are the same however the FQDNs fall into blocks
+    expected = write('unbound')
+
+    monkeypatch.setattr(writers, 'BLOCK_SIZE', 2)
+    assert write('unbound') == expected
+
+
+def test_gzip(tmp_path):
+    path = str(tmp_path / 'blackhole.txt.gz')
+
+    # written without a timestamp, the same list gives the same file
+    data = []
+    for _ in range(2):
+        with atomic_open(path) as output:
+            writers.write_output(output, DomainSet(FQDNS).sorted_keys(), 'text', compress=True)  # noqa: E501
+
+        with open(path, 'rb') as f:
+            data.append(f.read())
+
+    assert data[0] == data[1]
+    assert gzip.decompress(data[0]).decode('utf-8').splitlines() == write('text')   # noqa: E501
+
+# vim:sw=4:ts=4:et:fenc=utf-8: